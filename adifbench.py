@@ -0,0 +1,95 @@
+#!/bin/python
+# K1MU ADIF Parser - throughput benchmark
+# Copyright (c) 2020,2022
+#
+# Generates logs with adifgen and times adifparse on them, once per
+# engine and mode, each run in a process of its own so its peak RSS can
+# be read back with wait4().  Reports QSOs/s, MB/s and peak RSS.
+
+from optparse import OptionParser
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import adifgen
+
+# The modes timed, with the options that select them
+modes = {
+	'full' : [],
+	'quiet' : ['-q'],
+	'aggregate' : ['-g'],
+	'structure' : ['--structure-only'],
+}
+
+engines = ('fast', 'legacy')
+
+def option_parsing(args=None):
+	parser = OptionParser(usage='%prog [options]')
+
+	parser.add_option('-n', '--sizes', dest='sizes', default='1000,100000', help='Comma separated log sizes in QSOs (default 1000,100000)')
+	parser.add_option('-e', '--errors', dest='errors', type='float', default=0.01, help='Share of QSOs with a mistake (default 0.01)')
+	parser.add_option('--engines', dest='engines', default=','.join(engines), help='Comma separated engines to time (default %s)' % (','.join(engines)))
+	parser.add_option('--modes', dest='modes', default=','.join(modes), help='Comma separated modes to time (default %s)' % (','.join(modes)))
+	parser.add_option('-r', '--repeat', dest='repeat', type='int', default=1, help='Runs of each, keeping the fastest (default 1)')
+	parser.add_option('-k', '--keep', dest='keep', help='Keep the generated logs in this directory')
+
+	(options, args) = parser.parse_args(args)
+	for engine in options.engines.split(','):
+		if not engine in engines:
+			parser.error("unknown engine '%s'" % (engine))
+	for mode in options.modes.split(','):
+		if not mode in modes:
+			parser.error("unknown mode '%s'" % (mode))
+
+	return (options, args)
+
+#
+# Run adifparse on a log, returning the wall time and the peak RSS in bytes
+#
+def run(path, engine, mode, extra=[]):
+	parser = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'adifparse.py')
+	args = [sys.executable, parser, '-f', path, '-e', engine] + modes[mode] + extra
+	start = time.perf_counter()
+	with open(os.devnull, 'w') as null:
+		proc = subprocess.Popen(args, stdout=null)
+		(pid, status, usage) = os.wait4(proc.pid, 0)
+	elapsed = time.perf_counter() - start
+	status = os.waitstatus_to_exitcode(status)
+	if status != 0:
+		raise RuntimeError("%s failed with status %d" % (' '.join(args), status))
+	rss = usage.ru_maxrss
+	if sys.platform != 'darwin':		# Linux reports kilobytes
+		rss = rss * 1024
+	return (elapsed, rss)
+
+def main():
+	(opts, args) = option_parsing()
+
+	directory = opts.keep or tempfile.mkdtemp(prefix='adifbench')
+	os.makedirs(directory, exist_ok=True)
+	try:
+		print("%-8s %-10s %10s %9s %9s %12s %9s %10s" % ('Engine', 'Mode', 'QSOs', 'MB', 'Seconds', 'QSOs/s', 'MB/s', 'Peak RSS'))
+		for size in [int(n) for n in opts.sizes.split(',')]:
+			path = os.path.join(directory, 'bench%d.adi' % (size))
+			if not os.path.exists(path):
+				adifgen.generate(path, size, opts.errors)
+			mb = os.path.getsize(path) / 1048576.0
+			for engine in opts.engines.split(','):
+				for mode in opts.modes.split(','):
+					best = None
+					for i in range(opts.repeat):
+						result = run(path, engine, mode)
+						if best is None or result[0] < best[0]:
+							best = result
+					(elapsed, rss) = best
+					print("%-8s %-10s %10d %9.1f %9.2f %12.0f %9.2f %8.1fMB" % (engine, mode, size, mb, elapsed, size / elapsed, mb / elapsed, rss / 1048576.0))
+					sys.stdout.flush()
+	finally:
+		if not opts.keep:
+			shutil.rmtree(directory)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,220 @@
+#!/bin/python
+# K1MU ADIF Parser - engine conformance check
+# Copyright (c) 2020,2022
+#
+# Runs the reference engine (legacy, by default) and the engines
+# under test over a corpus - logs from adifgen plus the logs checked in
+# under samples/ and any named on the command line - and compares their
+# findings by rule, line and message.  Any difference fails the run, and
+# the time each engine took on each log is reported as a speedup over the
+# reference.
+#
+# The legacy engine has had fixes of its own since it was the original
+# parser, so every engine, the reference too, is also held to what the
+# original parser found on the logs in samples/.  Those findings are kept
+# under tests/golden, written by --write-golden from the original
+# adifparse.py, and the differences made on purpose are listed below.
+
+from optparse import OptionParser
+import difflib
+import glob
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import adifgen
+import adifparse
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'samples')
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'golden')
+
+# A finding in the original parser's report, and in run()'s list
+originalRe = re.compile(r'^(?:ADIF Compliance|Consistency) error on line (\d+): (.*)$', re.M)
+ruleRe = re.compile(r'^(line \d+) \w+(: )')
+
+# Samples the original parser can't be held to, and why
+NO_GOLDEN = {
+	'hostile.adi' : "The original has no limits - the field length of 999999999 swallows the rest of the log",
+}
+
+#
+# Where the parsers part from the original on purpose: for each sample, why,
+# the original's findings no longer made and the findings made instead.
+#
+KNOWN_DIFFERENCES = {
+	'emptysize.adi' : ("An empty length no longer swallows the character after it - a line end, or the '<' of <EOR> so that two records ran together", [
+		"line 4: Length field 'R' is not numeric",
+		"line 4: length field 'R' is not numeric",
+		"line 4: tag 'E' () is not a valid tag in a QSO record",
+		"line 6: tag 'BAND' appears more than once in a record, replacing old value 20M with new value 20M",
+		"line 6: tag 'CALL' appears more than once in a record, replacing old value G4AB with new value DL1A",
+		"line 6: tag 'MODE' appears more than once in a record, replacing old value SSB with new value SSB",
+		"line 6: tag 'NOTES' specifies type 'M' but is expected to be 'S'",
+		"line 6: tag 'QSO_DATE' appears more than once in a record, replacing old value 20200103 with new value 20200104",
+		"line 6: tag 'TIME_ON' appears more than once in a record, replacing old value 1400 with new value 1500",
+	], [
+		"line 5: Length field 'R' is not numeric",
+		"line 5: length field 'R' is not numeric",
+		"line 5: tag 'E' () is not a valid tag in a QSO record",
+		"line 9: tag 'NOTES' specifies type 'M' but is expected to be 'S'",
+	]),
+	'mixed.adi' : ("A carriage return on its own inside a field is no longer counted as a line end", [
+		"line 16: 'LOTW_QSLRDATE' should be a date but is 6 characters long, not 8",
+		"line 16: QSO Date of '19200101' is before the valid dates for dxcc 291 (UNITED STATES OF AMERICA)",
+		"line 16: tag 'LOTW_QSLRDATE' value '202001' should be a date but has invalid day",
+		"line 17: 'MY_IOTA' value 'XX0001' does not have a hyphen",
+		"line 17: 'MY_IOTA' value 'XX0001' isn't a valid continent",
+	], [
+		"line 15: 'LOTW_QSLRDATE' should be a date but is 6 characters long, not 8",
+		"line 15: QSO Date of '19200101' is before the valid dates for dxcc 291 (UNITED STATES OF AMERICA)",
+		"line 15: tag 'LOTW_QSLRDATE' value '202001' should be a date but has invalid day",
+		"line 16: 'MY_IOTA' value 'XX0001' does not have a hyphen",
+		"line 16: 'MY_IOTA' value 'XX0001' isn't a valid continent",
+	]),
+	'noeoh.adi' : ("The original stopped with a TypeError building the message for a QSO with no MODE", [], [
+		"line 1: QSO does not have a MODE",
+		"line 1: QSO does not have a valid date",
+		"line 1: QSO does not have a valid mode",
+		"line 1: QSO does not have a valid time",
+	]),
+}
+
+# Differing lines shown for each log that does not conform
+MAX_DIFF_LINES = 20
+
+def option_parsing(args=None):
+	parser = OptionParser(usage='%prog [options] [log ...]')
+
+	parser.add_option('-r', '--reference', dest='reference', default='legacy', help='Engine the others are held to (default legacy)')
+	parser.add_option('--engines', dest='engines', default='fast', help='Comma separated engines to check (default fast)')
+	parser.add_option('-n', '--sizes', dest='sizes', default='1000,10000', help='Comma separated sizes of the generated logs in QSOs, empty for none (default 1000,10000)')
+	parser.add_option('-e', '--errors', dest='errors', type='float', default=0.05, help='Share of generated QSOs with a mistake (default 0.05)')
+	parser.add_option('-s', '--seed', dest='seed', type='int', default=1, help='Random seed of the generated logs (default 1)')
+	parser.add_option('--no-samples', dest='samples', default=True, action="store_false", help='Leave out the logs in samples/')
+	parser.add_option('-k', '--keep', dest='keep', help='Keep the generated logs in this directory')
+	parser.add_option('--write-golden', dest='write_golden', metavar='ADIFPARSE', help='Write the findings of this copy of the original adifparse.py on samples/ to tests/golden and exit')
+
+	(options, args) = parser.parse_args(args)
+	options.engines = options.engines.split(',')
+	for engine in [options.reference] + options.engines:
+		if not engine in adifparse.engines:
+			parser.error("unknown engine '%s'" % (engine))
+
+	return (options, args)
+
+#
+# The findings of one engine on one log, one line each, and the time taken
+#
+def run(path, engine):
+	start = time.perf_counter()
+	result = adifparse.validateLog(path, ['-e', engine])
+	elapsed = time.perf_counter() - start
+	found = ["line %d %s: %s" % (f['line'], f['rule'], f['message']) for f in result['findings']]
+	found.append("%d lines, %d QSOs" % (result['lines'], result['qsos']))
+	return (found, elapsed)
+
+#
+# What the original parser would find on a sample now, from its golden
+# findings and the known differences, sorted as its report was not in
+# log order; None if there are no golden findings for the log.
+#
+def original(path):
+	name = os.path.basename(path)
+	golden = os.path.join(GOLDEN, name + '.txt')
+	if os.path.dirname(os.path.abspath(path)) != SAMPLES or not os.path.exists(golden):
+		return None
+	with open(golden) as f:
+		expected = f.read().splitlines()
+	if name in KNOWN_DIFFERENCES:
+		(why, removed, added) = KNOWN_DIFFERENCES[name]
+		for line in removed:
+			expected.remove(line)
+		expected = expected + added
+	return sorted(expected)
+
+#
+# run()'s findings as the original parser reported them, without rules
+#
+def asOriginal(found):
+	return sorted(ruleRe.sub(r'\1\2', line) for line in found[:-1])
+
+#
+# Run the original adifparse.py, next to its own adiftags.py, on each
+# sample and keep the findings from its report
+#
+def writeGolden(parser):
+	os.makedirs(GOLDEN, exist_ok=True)
+	for path in sorted(glob.glob(os.path.join(SAMPLES, '*.adi'))):
+		report = subprocess.run([sys.executable, os.path.abspath(parser), '-f', path], cwd=os.path.dirname(os.path.abspath(parser)),
+			stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+		found = sorted("line %s: %s" % m.groups() for m in originalRe.finditer(report))
+		name = os.path.basename(path)
+		if name in NO_GOLDEN:
+			print("%s: not written - %s" % (name, NO_GOLDEN[name]))
+			continue
+		with open(os.path.join(GOLDEN, name + '.txt'), 'w') as out:
+			out.write(''.join(line + '\n' for line in found))
+		print("%s: %d findings" % (name, len(found)))
+
+def main():
+	(opts, args) = option_parsing()
+	if opts.write_golden:
+		writeGolden(opts.write_golden)
+		return
+
+	directory = opts.keep or tempfile.mkdtemp(prefix='adifconform')
+	os.makedirs(directory, exist_ok=True)
+	failed = []
+	try:
+		logs = []
+		for size in [int(n) for n in opts.sizes.split(',') if n != '']:
+			path = os.path.join(directory, 'conform%d.adi' % (size))
+			adifgen.generate(path, size, opts.errors, opts.seed)
+			logs.append(path)
+		if opts.samples:
+			logs = logs + sorted(glob.glob(os.path.join(SAMPLES, '*.adi')))
+		logs = logs + args
+
+		print("%-28s %-8s %9s %9s %9s %s" % ('Log', 'Engine', 'Findings', 'Seconds', 'Speedup', 'Result'))
+		for path in logs:
+			name = os.path.basename(path)
+			golden = original(path)
+			(expected, reference) = run(path, opts.reference)
+			verdict = 'reference'
+			if golden is not None and asOriginal(expected) != golden:
+				verdict = 'reference, DIFFERENT from the original'
+				failed.append('%s/%s' % (name, opts.reference))
+			print("%-28s %-8s %9d %9.3f %9s %s" % (name, opts.reference, len(expected) - 1, reference, '', verdict))
+			if golden is not None and asOriginal(expected) != golden:
+				showDiff(golden, asOriginal(expected), 'original', opts.reference)
+			for engine in opts.engines:
+				(found, elapsed) = run(path, engine)
+				verdict = 'same'
+				if found != expected:
+					verdict = 'DIFFERENT'
+					failed.append('%s/%s' % (name, engine))
+				print("%-28s %-8s %9d %9.3f %8.1fx %s" % (name, engine, len(found) - 1, elapsed, reference / elapsed, verdict))
+				if found != expected:
+					showDiff(expected, found, opts.reference, engine)
+				sys.stdout.flush()
+	finally:
+		if not opts.keep:
+			shutil.rmtree(directory)
+
+	if failed:
+		print("Findings differ from the %s engine or the original parser on %s" % (opts.reference, ', '.join(failed)))
+		sys.exit(1)
+
+def showDiff(expected, found, fromName, toName):
+	diff = list(difflib.unified_diff(expected, found, fromName, toName, n=0, lineterm=''))
+	for line in diff[:MAX_DIFF_LINES]:
+		print("    " + line)
+	if len(diff) > MAX_DIFF_LINES:
+		print("    ... %d more" % (len(diff) - MAX_DIFF_LINES))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,192 @@
+#!/bin/python
+# K1MU ADIF Parser - synthetic log generator
+# Copyright (c) 2020,2022
+#
+# Writes ADIF logs that look like real ones, built from the tables in
+# adiftags: current DXCC entities with zones from their zonemap, states
+# and counties, BAND/FREQ pairs and MODE/SUBMODE combinations.  A share of
+# the QSOs can be given one mistake each, for benchmarks and for checking
+# that a change finds the same problems it did before.
+
+from optparse import OptionParser
+from datetime import date, datetime
+import random
+import sys
+
+from adiftags import *
+from adifparse import fixCounty
+
+# Dates a generated QSO may fall on, within the entity's valid dates
+FIRST_DAY = date(1990, 1, 1).toordinal()
+LAST_DAY = date(2022, 12, 31).toordinal()
+
+# QSOs built up before each write
+CHUNK = 10000
+
+def option_parsing(args=None):
+	parser = OptionParser(usage='%prog [options]')
+
+	parser.add_option('-n', '--count', dest='count', type='int', default=1000, help='Number of QSOs (default 1000)')
+	parser.add_option('-e', '--errors', dest='errors', type='float', default=0.0, help='Share of QSOs with a mistake in them, 0 to 1 (default 0)')
+	parser.add_option('-s', '--seed', dest='seed', type='int', default=1, help='Random seed (default 1)')
+	parser.add_option('-o', '--output', dest='output_file', help='File to write (default stdout)')
+
+	(options, args) = parser.parse_args(args)
+
+	return (options, args)
+
+def field(tag, value, type=None):
+	if type:
+		return '<%s:%d:%s>%s ' % (tag, len(value), type, value)
+	return '<%s:%d>%s ' % (tag, len(value), value)
+
+def day(isodate):
+	return datetime.strptime(isodate, "%Y-%m-%d %H:%M:%S").toordinal()
+
+class Generator:
+	def __init__(self, seed=1, errors=0.0):
+		self.random = random.Random(seed)
+		self.errors = errors
+		self.entities = []
+		for dxcc in enumerations['DXCC']:
+			entity = enumerations['DXCC'][dxcc]
+			if entity['deleted'] or entity['zonemap'] == [] or dxcc == '0':
+				continue
+			first = FIRST_DAY
+			if 'valid' in entity:
+				first = max(first, day(entity['valid']))
+			last = LAST_DAY
+			if 'invalid' in entity:
+				last = min(last, day(entity['invalid']))
+			if first <= last:
+				self.entities.append((dxcc, entity['name'], entity['zonemap'], first, last))
+		self.bands = []
+		for band in enumerations['BAND']:
+			(low, high) = enumerations['BAND'][band]
+			self.bands.append((band, float(low), float(high)))
+		self.modes = list(enumerations['MODE'].items())
+		# Leave out the few counties that fixCounty() can't match, such as
+		# HILLSBOROUGH, so a log without mistakes gives no findings
+		self.counties = {}
+		for state in sas:
+			self.counties[state] = [cnty for cnty in sas[state] if fixCounty(cnty) in sas[state]]
+		self.mistakes = (self.badZone, self.badState, self.badMode, self.badGrid,
+			self.freqOutOfBand, self.badDate, self.duplicateTag, self.badType, self.unknownTag)
+
+	def call(self):
+		r = self.random
+		letters = 'ABCDEFGHIJKLMNOPRSTUVWXYZ'
+		prefix = r.choice('AKNW') + r.choice(['', r.choice(letters)])
+		return prefix + str(r.randint(1, 9)) + ''.join(r.choice(letters) for i in range(r.randint(1, 3)))
+
+	def grid(self):
+		r = self.random
+		return r.choice('ABCDEFGHIJKLMNOPQR') + r.choice('ABCDEFGHIJKLMNOPQR') + str(r.randint(0, 9)) + str(r.randint(0, 9))
+
+	#
+	# One QSO, as an ordered list of (tag, value) or (tag, value, type)
+	#
+	def qso(self):
+		r = self.random
+		(dxcc, name, zonemap, first, last) = r.choice(self.entities)
+		fields = [('CALL', self.call())]
+		hour = r.randint(0, 22)
+		minute = r.randint(0, 59)
+		fields.append(('QSO_DATE', date.fromordinal(r.randint(first, last)).strftime('%Y%m%d')))
+		fields.append(('TIME_ON', '%02d%02d' % (hour, minute)))
+		fields.append(('TIME_OFF', '%02d%02d' % (hour + 1, minute)))
+		(band, low, high) = r.choice(self.bands)
+		fields.append(('BAND', band))
+		fields.append(('FREQ', '%.3f' % (r.uniform(low, high))))
+		(mode, submodes) = r.choice(self.modes)
+		fields.append(('MODE', mode))
+		if submodes and r.random() < 0.5:
+			fields.append(('SUBMODE', r.choice(submodes)))
+		fields.append(('DXCC', dxcc))
+		fields.append(('COUNTRY', name))
+		if dxcc in pas and pas[dxcc]:
+			state = r.choice(list(pas[dxcc]))
+			fields.append(('STATE', state))
+			if pas[dxcc][state]:
+				zonemap = pas[dxcc][state]
+			if dxcc == '291' and state in self.counties and self.counties[state]:
+				fields.append(('CNTY', state + ',' + r.choice(self.counties[state])))
+		(itu, cq) = r.choice(zonemap).split(':')
+		fields.append(('CQZ', str(int(cq))))
+		fields.append(('ITUZ', str(int(itu))))
+		fields.append(('GRIDSQUARE', self.grid()))
+		fields.append(('RST_SENT', '59'))
+		fields.append(('RST_RCVD', '59'))
+		fields.append(('QSL_RCVD', r.choice('YN')))
+		if self.errors and r.random() < self.errors:
+			r.choice(self.mistakes)(fields)
+		return fields
+
+	#
+	# Mistakes, each changing the fields of one QSO
+	#
+	def replace(self, fields, tag, value):
+		for i in range(len(fields)):
+			if fields[i][0] == tag:
+				fields[i] = (tag, value)
+				return
+		fields.append((tag, value))
+
+	def badZone(self, fields):
+		self.replace(fields, 'CQZ', '40')
+		self.replace(fields, 'ITUZ', '90')
+
+	def badState(self, fields):
+		self.replace(fields, 'STATE', 'ZZ')
+
+	def badMode(self, fields):
+		self.replace(fields, 'MODE', 'XYZ')
+
+	def badGrid(self, fields):
+		self.replace(fields, 'GRIDSQUARE', 'ZZ99')
+
+	def freqOutOfBand(self, fields):
+		self.replace(fields, 'BAND', '20M')
+		self.replace(fields, 'FREQ', '7.074')
+
+	def badDate(self, fields):
+		self.replace(fields, 'QSO_DATE', '20221345')
+
+	def duplicateTag(self, fields):
+		fields.append(('CALL', self.call()))
+
+	def badType(self, fields):
+		fields.append(('NAME', 'BOB', 'X'))
+
+	def unknownTag(self, fields):
+		fields.append(('NOT_A_TAG', 'X'))
+
+	def header(self):
+		return 'Generated by adifgen\n' + field('ADIF_VER', '3.1.0') + field('PROGRAMID', 'adifgen') + field('PROGRAMVERSION', '1.0') + '<EOH>\n'
+
+	def record(self, fields):
+		return ''.join(field(*f) for f in fields) + '<EOR>\n'
+
+	def write(self, out, count):
+		out.write(self.header().encode())
+		done = 0
+		while done < count:
+			n = min(CHUNK, count - done)
+			out.write(''.join(self.record(self.qso()) for i in range(n)).encode())
+			done = done + n
+
+def generate(path, count, errors=0.0, seed=1):
+	with open(path, 'wb') as out:
+		Generator(seed, errors).write(out, count)
+
+def main():
+	(opts, args) = option_parsing()
+	gen = Generator(opts.seed, opts.errors)
+	if opts.output_file:
+		with open(opts.output_file, 'wb') as out:
+			gen.write(out, opts.count)
+	else:
+		gen.write(sys.stdout.buffer, opts.count)
+
+if __name__ == '__main__':
+	main()
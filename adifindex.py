@@ -0,0 +1,180 @@
+#!/bin/python
+# K1MU ADIF Parser - record index
+# Copyright (c) 2020,2022
+#
+# An index (.adiidx) file sits beside an ADIF log and holds the byte offset,
+# length, first line and QSO_DATE/CALL of every QSO record, so that records
+# can be fetched, re-validated or shared out between workers without
+# rescanning the log.
+#
+# Layout, all integers little-endian:
+#	8 bytes		magic 'ADIFIDX1'
+#	4 x int64	record count, size of the log, offset of the first
+#			record, length of the user tag table
+#	...		user tag table (JSON) from the log's header
+#	n x int64	record offsets
+#	n x int64	record lengths
+#	n x int64	line each record starts on
+#	n x int64	QSO_DATE as YYYYMMDD, 0 if missing or not a date
+#	n x 16 bytes	CALL, NUL padded
+
+from array import array
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+
+INDEX_MAGIC = b'ADIFIDX1'
+INDEX_HEADER = struct.Struct('<8sqqqq')
+CALL_SIZE = 16
+
+fieldRe = re.compile(rb'<([^:>]*)(?::([0-9]+)(?::[^>]*)?)?>')
+
+def indexPath(logPath):
+	return os.path.splitext(logPath)[0] + '.adiidx'
+
+def column():
+	col = array('q')
+	if col.itemsize != 8:
+		raise ValueError("platform has no 64 bit array type")
+	return col
+
+class AdifIndex:
+	def __init__(self):
+		self.offsets = column()
+		self.lengths = column()
+		self.lines = column()
+		self.dates = column()
+		self.calls = bytearray()
+		self.logSize = 0
+		self.headerEnd = 0
+		self.userTags = {}
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def append(self, offset, length, line, qsoDate, call):
+		self.offsets.append(offset)
+		self.lengths.append(length)
+		self.lines.append(line)
+		if len(qsoDate) == 8 and qsoDate.isdigit():
+			self.dates.append(int(qsoDate))
+		else:
+			self.dates.append(0)
+		call = call.encode('ascii', 'replace')[:CALL_SIZE]
+		self.calls += call + b'\0' * (CALL_SIZE - len(call))
+
+	def key(self, n):
+		date = self.dates[n]
+		call = self.calls[n * CALL_SIZE:(n + 1) * CALL_SIZE].rstrip(b'\0').decode('ascii')
+		if date == 0:
+			return ('', call)
+		return ('%08d' % date, call)
+
+	def save(self, path):
+		tags = json.dumps(self.userTags).encode()
+		with open(path, 'wb') as out:
+			out.write(INDEX_HEADER.pack(INDEX_MAGIC, len(self), self.logSize, self.headerEnd, len(tags)))
+			out.write(tags)
+			for col in (self.offsets, self.lengths, self.lines, self.dates):
+				if sys.byteorder == 'big':
+					col = array('q', col)
+					col.byteswap()
+				col.tofile(out)
+			out.write(self.calls)
+
+	@classmethod
+	def load(cls, path):
+		index = cls()
+		with open(path, 'rb') as inp:
+			(magic, count, index.logSize, index.headerEnd, tagLen) = INDEX_HEADER.unpack(inp.read(INDEX_HEADER.size))
+			if magic != INDEX_MAGIC:
+				raise ValueError("%s is not an ADIF record index" % (path))
+			index.userTags = json.loads(inp.read(tagLen))
+			for col in (index.offsets, index.lengths, index.lines, index.dates):
+				col.fromfile(inp, count)
+				if sys.byteorder == 'big':
+					col.byteswap()
+			index.calls = bytearray(inp.read(count * CALL_SIZE))
+		return index
+
+#
+# An ADIF log opened together with its index.
+#
+class AdifLog:
+	def __init__(self, logPath, idxPath=None):
+		self.index = AdifIndex.load(idxPath or indexPath(logPath))
+		self.file = open(logPath, 'rb')
+		size = os.fstat(self.file.fileno()).st_size
+		if size != self.index.logSize:
+			self.file.close()
+			raise ValueError("index does not match %s - it was built for a %d byte file, not %d" % (logPath, self.index.logSize, size))
+		self.buf = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def __len__(self):
+		return len(self.index)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		self.buf.close()
+		self.file.close()
+
+	def span(self, n):
+		offset = self.index.offsets[n]
+		return (offset, offset + self.index.lengths[n])
+
+	def record(self, n):
+		(start, end) = self.span(n)
+		return self.buf[start:end]
+
+	def line(self, n):
+		return self.index.lines[n]
+
+	def key(self, n):
+		return self.index.key(n)
+
+	# The tags of record n, without any checking
+	def fields(self, n):
+		rec = self.record(n)
+		tags = {}
+		pos = 0
+		while True:
+			m = fieldRe.search(rec, pos)
+			if not m:
+				break
+			pos = m.end()
+			if m.group(2) is None:
+				continue
+			size = int(m.group(2))
+			tags[m.group(1).decode('ascii', 'replace').strip().upper()] = rec[pos:pos + size].decode('ascii', 'replace')
+			pos = pos + size
+		return tags
+
+	# Split the records into 'parts' runs of about the same size in bytes
+	def partition(self, parts):
+		runs = []
+		count = len(self)
+		if count == 0:
+			return runs
+		total = self.index.offsets[count - 1] + self.index.lengths[count - 1] - self.index.offsets[0]
+		first = 0
+		for part in range(1, parts + 1):
+			target = self.index.offsets[0] + total * part // parts
+			last = bisect.bisect_left(self.index.offsets, target, first)
+			if part == parts:
+				last = count
+			if last > first:
+				runs.append((first, last))
+			first = last
+		return runs
+
+def openLog(logPath, idxPath=None):
+	return AdifLog(logPath, idxPath)
@@ -3,11 +3,27 @@
 # Copyright (c) 2020,2022
 
 from optparse import OptionParser
+import bisect
+import gzip
+import heapq
+import io
+import json
+import mmap
 import os
+import re
+import signal
 import sys
+import time
+import tracemalloc
 from datetime import datetime
+try:
+	import resource
+except ImportError:			# not on Windows
+	resource = None
 
 from adiftags import *
+import adifindex
+import adifreport
 
 # States of the ADIF parsing machine
 ADIF_STATE_BEGIN = 1
@@ -19,77 +35,676 @@ ADIF_STATE_GET_NEWLINE = 6
 ADIF_STATE_CHECK = 7
 ADIF_STATE_DONE = 8
 
-def option_parsing():
+# A tag header - name, then optional size and type
+tagRe = re.compile(rb'<([^:>]*)(?::([^:>]*)(?::([^>]*))?)?>')
+# Bytes within a data field that need a closer look
+dataRe = re.compile(rb'[\r\n\x80-\xff]')
+newlineRe = re.compile(rb'\n')
+# A '<' that plausibly starts a tag, to pick up from after garbage
+resyncRe = re.compile(rb'<[A-Za-z][A-Za-z0-9_]*(?::[0-9]+(?::[A-Za-z])?)?>')
+# Longest tag header (name, size and type) that will be looked at
+MAX_TAG_HEADER = 4096
+# Maps bytes above 127 to a space when decoding a field
+asciiTable = bytes(range(128)) + b' ' * 128
+
+# Tag names and data types as found in the file, and as we use them.  A
+# log can make up any number of names, so the cache is emptied when full.
+tagNames = {}
+MAX_TAG_NAMES = 4096
+
+# The input is examined in blocks of this size: line numbers are only
+# needed when something is reported, so they are computed from byte
+# offsets on demand, and whole blocks are checked for non-ASCII bytes.
+BLOCK_SIZE = 1048576
+
+# Buffer in front of a compressed report
+REPORT_BUFFER = 1048576
+
+# Checkpoints are version CHECKPOINT_VERSION, and with --checkpoint one is
+# written at the end of a record at most every CHECKPOINT_INTERVAL seconds.
+# A run is only resumed with the options that change what is found.
+CHECKPOINT_VERSION = 2
+CHECKPOINT_INTERVAL = 60.0
+checkpointOptions = ('engine', 'structure_only', 'only', 'skip', 'max_field', 'max_record', 'max_length_errors')
+
+# The parsing engines, fast first as the default
+engines = ('fast', 'legacy')
+
+# Every CHECK_BYTES of the log, in records or not, --progress looks at the
+# clock, and it writes a line at most every PROGRESS_INTERVAL seconds
+CHECK_BYTES = 65536
+PROGRESS_INTERVAL = 1.0
+
+# --memstats: the subsystem each module's allocations are charged to, and
+# the number of allocating lines listed
+memSubsystems = {
+	'adiftags.py' : 'reference tables',
+	'adifparse.py' : 'parser, records and findings',
+	'adifreport.py' : 'report sinks and buffers',
+	'adifindex.py' : 'record index',
+}
+MEM_TOP_LINES = 10
+
+def option_parsing(args=None):
 	parser = OptionParser()
 
 	parser.add_option('-f', '--file', dest='input_file', help='File to parse')
 	parser.add_option('-a', '--compliance', dest='comp_file', help='Output file for compliance report')
 	parser.add_option('-c', '--consistency', dest='cons_file', help='Output file for consistency report')
 	parser.add_option('-w', '--html', dest='html', default=False, action="store_true", help='Output in HTML Format')
-
-	(options, args) = parser.parse_args()
+	parser.add_option('--format', dest='format', choices=list(adifreport.formats), help='Report format: text (default), html or ndjson (one JSON finding per line)')
+	parser.add_option('-s', '--structure-only', dest='structure_only', default=False, action="store_true", help='Only check the ADIF structure: tags, lengths, data types, header and records')
+	parser.add_option('--header-only', dest='header_only', default=False, action="store_true", help='Only read and check the header, and list its tags')
+	parser.add_option('--only', dest='only', default='', help='Run only these QSO checks, comma separated: %s' % (', '.join(qsoChecks)))
+	parser.add_option('--skip', dest='skip', default='', help='Skip these QSO checks, comma separated')
+	parser.add_option('-g', '--aggregate', dest='aggregate', default=False, action="store_true", help='Report each distinct finding once, with a count and the first lines it is on')
+	parser.add_option('-o', '--output', dest='outputs', default=[], action='append', metavar='FORMAT:FILE', help='Also write a report in FORMAT (text, html or ndjson) to FILE, paged HTML with pages:DIRECTORY or a database with sqlite:FILE; may be repeated')
+	parser.add_option('-z', '--compress', dest='compress', default=False, action="store_true", help='Gzip the report files, adding .gz to their names; not with -o pages: or sqlite:')
+	parser.add_option('--page-size', dest='page_size', type='int', default=1000, help='Findings on each page of a pages: report (default 1000)')
+	parser.add_option('-p', '--progress', dest='progress', default=False, action="store_true", help='Show progress, QSOs/s, errors so far and the time left on stderr')
+	parser.add_option('-q', '--quiet', dest='quiet', default=False, action="store_true", help='Do not write the main report, only count the findings')
+	parser.add_option('--max-errors', dest='max_errors', type='int', default=0, help='Stop after this many errors, 0 for no limit (default 0)')
+	parser.add_option('--time-budget', dest='time_budget', type='float', default=0, metavar='SECONDS', help='Stop at the end of the first record after SECONDS, or within 64 KB in a long one, and report what was found so far, 0 for no limit (default 0)')
+	parser.add_option('--fail-fast', dest='fail_fast', default=False, action="store_true", help='Stop at the first compliance error and exit with status 1')
+	parser.add_option('-e', '--engine', dest='engine', default='fast', choices=list(engines), help='Parsing engine: fast (default) or legacy (character at a time)')
+	parser.add_option('-x', '--index', dest='index_file', help='Write a record index (.adiidx) to this file')
+	parser.add_option('--checkpoint', dest='checkpoint', metavar='FILE', help='Save where validation got to in FILE, at the end of a record, every minute and when it stops early or is sent SIGTERM')
+	parser.add_option('--resume', dest='resume', metavar='FILE', help='Carry on from a checkpoint saved with --checkpoint, without reading the log before it')
+	parser.add_option('--max-field', dest='max_field', type='int', default=1048576, help='Longest data field accepted, in bytes (default 1048576)')
+	parser.add_option('--max-record', dest='max_record', type='int', default=16777216, help='Longest record accepted, in bytes (default 16777216)')
+	parser.add_option('--profile', dest='profile', default=False, action="store_true", help='Report the wall and CPU time spent in each phase of the run')
+	parser.add_option('--memstats', dest='memstats', default=False, action="store_true", help='Report peak RSS, the memory held by each subsystem and the bytes kept per QSO')
+	parser.add_option('--stats', dest='stats', metavar='FILE', help='Write the time, calls and findings of each phase and check, the count of each rule and a histogram of the time taken by each record to FILE as JSON')
+	parser.add_option('--max-record-findings', dest='max_record_findings', type='int', default=10000, help='Compliance errors listed for one record, the rest only counted (default 10000)')
+	parser.add_option('--max-length-errors', dest='max_length_errors', type='int', default=500, help='Consecutive bad length fields before skipping to the next tag (default 500)')
+
+	(options, args) = parser.parse_args(args)
+	if options.format is None:
+		options.format = 'html' if options.html else 'text'
+	options.html = options.format == 'html'
+	outputs = []
+	for output in options.outputs:
+		(format, sep, path) = output.partition(':')
+		if format not in adifreport.outputFormats or path == '':
+			parser.error("-o wants FORMAT:FILE with FORMAT one of %s, not '%s'" % (', '.join(adifreport.outputFormats), output))
+		# A directory of pages and a database are not single report files
+		if options.compress and format in ('pages', 'sqlite'):
+			parser.error("--compress can't be used with -o %s:, which is not written as a single report file" % (format))
+		outputs.append((format, path))
+	options.outputs = outputs
+	if options.resume and options.index_file:
+		parser.error("a record index needs the whole log, so --index cannot be used with --resume")
+	# A resumed run's reports hold only what is found after the checkpoint,
+	# so they must not replace the reports of the run before it
+	if options.resume:
+		for path in [options.comp_file, options.cons_file] + [path for (format, path) in outputs if format != 'sqlite']:
+			if path and options.compress and not path.endswith('.gz'):
+				path = path + '.gz'
+			if path and os.path.exists(path):
+				parser.error("%s already exists - a run resumed with --resume needs new report files, not those of the run before it" % (path))
+	for check in ('only', 'skip'):
+		names = [name.strip().lower() for name in getattr(options, check).split(',') if name.strip() != '']
+		for name in names:
+			if not name in qsoChecks:
+				parser.error("--%s: unknown check '%s' - the checks are %s" % (check, name, ', '.join(qsoChecks)))
+		setattr(options, check, names)
 
 	return (options, args)
 
+#
+# Map a byte offset in the input to a line number.  The number of newlines
+# before each block is counted with bytes.count() as it is first needed,
+# and the newline offsets of the block being reported on are bisected.
+# Blocks are counted from 'base', whose line is known - the start of the
+# log, or where a resumed run picks up.
+#
+def indexBuffer(buf, base=0, baseLine=1):
+	global lineBuf
+	global lineBase
+	global lineCounts
+	global lineBlock
+	global lineOffsets
+	global asciiBlocks
+	lineBuf = buf
+	lineBase = base
+	lineCounts = [baseLine - 1]
+	lineBlock = -1
+	lineOffsets = []
+	asciiBlocks = {}
+
+def lineAt(pos):
+	global lineBlock
+	global lineOffsets
+	block = (pos - lineBase) // BLOCK_SIZE
+	while len(lineCounts) <= block:
+		start = lineBase + (len(lineCounts) - 1) * BLOCK_SIZE
+		lineCounts.append(lineCounts[-1] + lineBuf[start:start + BLOCK_SIZE].count(b'\n'))
+	if block != lineBlock:
+		start = lineBase + block * BLOCK_SIZE
+		lineOffsets = [m.start() + start for m in newlineRe.finditer(lineBuf[start:start + BLOCK_SIZE])]
+		lineBlock = block
+	return lineCounts[block] + bisect.bisect_left(lineOffsets, pos) + 1
+
+#
+# Find the run of pure ASCII blocks that starts with the block holding
+# 'start' and reaches 'end' if it can.  Each block is tested once, with
+# bytes.isascii(), so only fields in blocks with high bytes need a look.
+#
+def asciiRange(start, end):
+	first = start // BLOCK_SIZE
+	block = first
+	while block == first or block * BLOCK_SIZE < end:
+		if not block in asciiBlocks:
+			asciiBlocks[block] = lineBuf[block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE].isascii()
+		if not asciiBlocks[block]:
+			break
+		block = block + 1
+	return (first * BLOCK_SIZE, block * BLOCK_SIZE)
+
 # Verify that the tag/value/type is sensible
 
-def complianceError(msg, line):
+#
+# Every finding has a stable rule code, mapped here to its message and to
+# which of the message arguments (or which literal tag) names the tag and
+# the offending value.
+#
+findingRules = {
+	'CALL_CHARACTERS' : ("'%s' is not an amateur callsign as it has unexpected characters", None, 0),
+	'CALL_TOO_SHORT' : ("'%s' is not an amateur callsign - it's too short", None, 0),
+	'CALL_IMPLAUSIBLE' : ("'%s' is not a plausible amateur callsign", None, 0),
+	'LENGTH_NOT_NUMERIC' : ("length field '%s' is not numeric", None, None),
+	'TYPE_MISMATCH' : ("tag '%s' specifies type '%s' but is expected to be '%s'", 0, None),
+	'NOT_BOOLEAN' : ("tag '%s' should be 'Y' or ''N but is '%s'", 0, 1),
+	'NOT_NUMBER' : ("tag '%s' should be a number but is '%s'", 0, 1),
+	'OUT_OF_RANGE' : ("tag '%s' should be in the range %d to %d but is %s", 0, 3),
+	'NOT_POSITIVE' : ("tag '%s' should be a positive number but has '%s'", 0, 1),
+	'DATE_LENGTH' : ("'%s' should be a date but is %d characters long, not 8", 0, None),
+	'DATE_YEAR' : ("tag '%s' should be a date but '%s' has an invalid year", 0, 1),
+	'DATE_MONTH' : ("tag '%s' value '%s' should be a date but has an invalid month '%s'", 0, 1),
+	'DATE_DAY' : ("tag '%s' value '%s' should be a date but has invalid day", 0, 1),
+	'TIME_NOT_NUMERIC' : ("tag '%s' should be a time but'%s' is not numeric", 0, 1),
+	'TIME_LENGTH' : ("tag '%s' should be a time but it is %d characters long not 4 or 6", 0, None),
+	'LOCATION_LENGTH' : ("tag '%s' should be 11 characters long but is %d", 0, None),
+	'LOCATION_DIRECTION' : ("Location '%s' value '%s' does not start with N,S,E, or W.", 0, 1),
+	'LOCATION_DEGREES' : ("Location '%s' value '%s' degrees is not numeric", 0, 1),
+	'LOCATION_DEGREES_RANGE' : ("Location '%s' value '%s' degrees is not in range 0 through 180", 0, 1),
+	'LOCATION_MINUTES' : ("Location '%s' value '%s' minutes is not numeric", 0, 1),
+	'LOCATION_MINUTES_RANGE' : ("Location '%s' value '%s' minutes is not in range 0 through 59", 0, 1),
+	'LOCATION_SECONDS' : ("Location '%s' value '%s' seconds is not numeric", 0, 1),
+	'LOCATION_SECONDS_RANGE' : ("Location '%s' value '%s' seconds is not in range 0 through 999", 0, 1),
+	'NO_ENUMERATIONS' : ("tag '%s' does not have any enumerations - internal error!", 0, None),
+	'NOT_ENUMERATED' : ("The tag '%s' has an invalid value '%s' - not in the enumerations", 0, 1),
+	'IOTA_LENGTH' : ("'%s' value '%s' is not 6 characters", 0, 1),
+	'IOTA_CONTINENT' : ("'%s' value '%s' isn't a valid continent", 0, 1),
+	'IOTA_HYPHEN' : ("'%s' value '%s' does not have a hyphen", 0, 1),
+	'IOTA_NUMBER' : ("'%s' value '%s' does not have a number after the hyphen", 0, 1),
+	'UNHANDLED_TYPE' : ("Internal failure to handle tag '%s' type '%s'", 0, None),
+	'BAD_GRID' : ("'%s' is an invalid gridsquare", None, 0),
+	'BAD_SUBSQUARE' : ("'%s' is an invalid gridsquare (subsquare)", None, 0),
+	'BAD_MODE' : ("'%s' is not a valid MODE", 'MODE', 0),
+	'SUBMODE_WITHOUT_MODE' : ("SUBMODE '%s' without a valid MODE", 'SUBMODE', 0),
+	'BAD_SUBMODE' : ("'%s' is not a valid SUBMODE for MODE '%s'", 'SUBMODE', 0),
+	'NON_ASCII_TAG' : ("Non-ASCII character in input file, tag %s", 0, None),
+	'NON_ASCII' : ("Non-ASCII character in input file", None, None),
+	'NON_ASCII_CHAR_TAG' : ("Non-ASCII character %s in input file, tag %s", 1, 0),
+	'NON_ASCII_CHAR' : ("Non-ASCII character '%s' in input file", None, 0),
+	'DUPLICATE_HEADER_TAG' : ("tag '%s' appears more than once in the header, replacing old value %s with new value %s", 0, 2),
+	'DUPLICATE_TAG' : ("tag '%s' appears more than once in a record, replacing old value %s with new value %s", 0, 2),
+	'HEADER_TOO_LONG' : ("The header is longer than %d bytes - discarding it", None, None),
+	'RECORD_TOO_LONG' : ("Record is longer than %d bytes without an <EOR> - discarding it", None, None),
+	'BAD_HEADER_TAG' : ("tag '%s' is not a valid tag in the header", 0, None),
+	'EOR_IN_HEADER' : ("Got <EOR> tag while processing header", 'EOR', None),
+	'BAD_TAG' : ("tag '%s' (%s) is not a valid tag in a QSO record", 0, 1),
+	'EOH_IN_RECORD' : ("Got  EOH tag while not in the header", 'EOH', None),
+	'SIZE_NOT_NUMERIC' : ("Length field '%s' is not numeric", None, 0),
+	'BAD_DATA_TYPE' : ("Data Type '%s' is not valid", None, 0),
+	'NEWLINE_WITHOUT_RETURN' : ("Newline in data string for %s did not have preceding Return", 0, None),
+	'RETURN_WITHOUT_NEWLINE' : ("Return in data string for %s did not have following Newline", 0, None),
+	'FIELD_TOO_LONG' : ("tag '%s' has length %d, more than the maximum of %d - skipping it", 0, None),
+	'LENGTH_ERRORS' : ("More than %d consecutive length fields are not numeric - skipping to the next tag", None, None),
+	'TAG_TOO_LONG' : ("Tag is longer than %d bytes - skipping to the next tag", None, None),
+	'FINDINGS_NOT_LISTED' : ("%d more compliance errors in this record are counted but not listed", None, None),
+
+	'COUNTY_STATE' : ("%s value of '%s' specifies state '%s' but the STATE is set to '%s'", 0, 1),
+	'BAD_COUNTY' : ("%s value of '%s' is not valid for DXCC %s (%s) and STATE '%s'", 0, 1),
+	'FREQ_OUT_OF_BAND' : ("Frequency '%s' is out of range for band '%s'", 'FREQ', 0),
+	'NO_BAND' : ("QSO does not have a band or a frequency specified", 'BAND', None),
+	'FREQ_RX_OUT_OF_BAND' : ("RX Frequency '%s' is out of range for band '%s'", 'FREQ_RX', 0),
+	'COUNTRY_DXCC' : ("The COUNTRY is for DXCC entity %s (%s) but the DXCC tag has %s (%s)", 'COUNTRY', None),
+	'MY_COUNTRY_DXCC' : ("The MY_COUNTRY is for DXCC entity %s (%s) but the DXCC tag says %s (%s)", 'MY_COUNTRY', None),
+	'STATE_NO_DXCC_HAWAII' : ("The QSO contains STATE '%s' but the QSO record has no valid DXCC entity - assuming HAWAII", 'STATE', 0),
+	'STATE_NO_DXCC_ALASKA' : ("The QSO contains STATE '%s' but the QSO record has no valid DXCC entity - assuming ALASKA", 'STATE', 0),
+	'STATE_NO_DXCC' : ("The QSO contains STATE '%s' but the QSO record has no valid DXCC entity", 'STATE', 0),
+	'STATE_NOT_USED' : ("DXCC Entity %s (%s) does not have a primary adminstrative subdivision but the QSO contains STATE '%s'", 'STATE', 2),
+	'BAD_STATE' : ("State '%s' is not valid for DXCC %s (%s)", 'STATE', 0),
+	'MY_STATE_NO_DXCC_HAWAII' : ("The QSO contains MY_STATE '%s' but the QSO record has no valid DXCC entity - assuming HAWAII", 'MY_STATE', 0),
+	'MY_STATE_NO_DXCC_ALASKA' : ("The QSO contains MY_STATE '%s' but the QSO record has no valid DXCC entity - assuming ALASKA", 'MY_STATE', 0),
+	'MY_STATE_NO_DXCC' : ("The QSO contains MY_STATE '%s' but the QSO record has no valid DXCC entity", 'MY_STATE', 0),
+	'MY_STATE_NOT_USED' : ("DXCC Entity %s (%s) does not have a primary adminstrative subdivision but the QSO contains MY_STATE '%s'", 'MY_STATE', 2),
+	'BAD_MY_STATE' : ("MY_STATE '%s' is not valid for DXCC %s (%s)", 'MY_STATE', 0),
+	'NO_MODE' : ("QSO does not have a MODE", 'MODE', None),
+	'BAD_ITUZ' : ("ITU Zone '%s' is not correct for the %s '%s'", 'ITUZ', 0),
+	'BAD_CQZ' : ("CQ Zone '%s' is not correct for the %s '%s'", 'CQZ', 0),
+	'BAD_MY_ITUZ' : ("MY_ITUZ Zone '%s' is not correct for the %s '%s'", 'MY_ITUZ', 0),
+	'BAD_MY_CQZ' : ("MY_CQZ Zone '%s' is not correct for the %s '%s'", 'MY_CQZ', 0),
+	'NO_DATE' : ("QSO does not have a valid date", 'QSO_DATE', None),
+	'NO_TIME' : ("QSO does not have a valid time", 'TIME_ON', None),
+	'TIME_OFF_WITHOUT_ON' : ("QSO has a TIME_OFF but no TIME_ON", 'TIME_OFF', None),
+	'TIME_OFF_BEFORE_ON' : ("QSO TIME_OFF is %s/%s, which is before the QSO TIME_ON of %s/%s", 'TIME_OFF', 1),
+	'NO_VALID_MODE' : ("QSO does not have a valid mode", 'MODE', None),
+	'DATE_BEFORE_ENTITY' : ("QSO Date of '%s' is before the valid dates for dxcc %s (%s)", 'QSO_DATE', 0),
+	'DATE_AFTER_ENTITY' : ("QSO Date of '%s' is after the valid dates for dxcc %s (%s)", 'QSO_DATE', 0)
+}
+
+#
+# The checks verifyQSO() makes, each with the rules it reports and the
+# checks it needs the results of.  --only and --skip choose among them; a
+# check that is not chosen is only run if a chosen one needs it, and its
+# findings are dropped.
+#
+qsoChecks = {
+	'grids' : (('BAD_GRID', 'BAD_SUBSQUARE'), ()),
+	'band' : (('FREQ_OUT_OF_BAND', 'NO_BAND', 'FREQ_RX_OUT_OF_BAND'), ()),
+	'dxcc' : (('COUNTRY_DXCC', 'MY_COUNTRY_DXCC'), ()),
+	'state' : (('STATE_NO_DXCC_HAWAII', 'STATE_NO_DXCC_ALASKA', 'STATE_NO_DXCC', 'STATE_NOT_USED', 'BAD_STATE',
+		'MY_STATE_NO_DXCC_HAWAII', 'MY_STATE_NO_DXCC_ALASKA', 'MY_STATE_NO_DXCC', 'MY_STATE_NOT_USED', 'BAD_MY_STATE'), ('dxcc',)),
+	'mode' : (('NO_MODE', 'BAD_MODE', 'SUBMODE_WITHOUT_MODE', 'BAD_SUBMODE', 'NO_VALID_MODE'), ()),
+	'counties' : (('COUNTY_STATE', 'BAD_COUNTY'), ('dxcc', 'state')),
+	'zones' : (('BAD_ITUZ', 'BAD_CQZ', 'BAD_MY_ITUZ', 'BAD_MY_CQZ'), ('dxcc', 'state')),
+	'dates' : (('NO_DATE', 'NO_TIME', 'TIME_OFF_WITHOUT_ON', 'TIME_OFF_BEFORE_ON', 'DATE_BEFORE_ENTITY', 'DATE_AFTER_ENTITY'), ('dxcc', 'state'))
+}
+
+def selectChecks():
+	global runChecks
+	global skipRules
+	chosen = set(qsoChecks)
+	if opts.only:
+		chosen = set(opts.only)
+	chosen = chosen - set(opts.skip)
+	runChecks = {}
+	skipRules = set()
+	for check in qsoChecks:
+		runChecks[check] = check in chosen
+		if not check in chosen:
+			skipRules.update(qsoChecks[check][0])
+	for check in chosen:
+		for need in qsoChecks[check][1]:
+			runChecks[need] = True
+
+#
+# A finding is kept as its rule code, position and message arguments, and
+# only rendered if a sink writes it.
+#
+class Finding:
+	__slots__ = ('rule', 'pos', 'args', 'tag', 'value', 'severity', 'qso', 'lineNo')
+
+	def __init__(self, rule, pos, args, tag, value, severity, qso):
+		self.rule = rule
+		self.pos = pos
+		self.args = args
+		self.tag = tag
+		self.value = value
+		self.severity = severity
+		self.qso = qso
+		self.lineNo = 0
+
+	def line(self):
+		if self.lineNo == 0:
+			self.lineNo = lineAt(self.pos)
+		return self.lineNo
+
+	def message(self):
+		return findingRules[self.rule][0] % self.args
+
+	def tagName(self):
+		if self.tag is None:
+			spec = findingRules[self.rule][1]
+			if isinstance(spec, str):
+				return spec
+			if spec is not None:
+				return self.args[spec]
+		return self.tag
+
+	def valueText(self):
+		value = self.value
+		if value is None:
+			spec = findingRules[self.rule][2]
+			if spec is None:
+				return None
+			value = self.args[spec]
+		return str(value)
+
+#
+# Raised to end validation early, for --max-errors and --fail-fast.
+#
+class StopValidation(Exception):
+	pass
+
+#
+# Raised when a checkpoint can't be resumed from.
+#
+class CheckpointError(Exception):
+	pass
+
+def report(f):
+	for sink in sinks:
+		sink.finding(f)
+
+def checkErrorLimit():
+	if opts.max_errors and compErrors + consErrors >= opts.max_errors:
+		raise StopValidation("Stopped after %d errors - the report is truncated" % (opts.max_errors))
+
+def complianceError(rule, pos, *args, tag=None, value=None):
 	global compErrors
-	global compFile
-	global compString
-	if not 'comp' in suppressions:
-		if opts.html:	
-			compFile.write("<h3>The following messages represent issues where the submitted ADIF file is not compliant with the ADIF standard.</h3>\n")
-		else:
-			compFile.write("The following messages represent issues where the submitted ADIF file is not compliant\nwith the ADIF standard.\n\n")
-		suppressions['comp'] = True
-	compString = compString + "ADIF Compliance error on line %d: %s" % (line, msg)
-	if opts.html:
-		compString = compString + "<br />"
-	compString = compString + "\n"
+	global compNotListed
+	if rule in skipRules:
+		return
 	compErrors = compErrors + 1
+	if profiling:
+		countFinding(rule)
+	# With no sinks to send them to, findings are only counted
+	if sinks:
+		f = Finding(rule, pos, args, tag, value, 'compliance', qsoKey)
+		# Findings on a record's tags wait for its EOR to learn the QSO key
+		if inHeader or qsoKey is not None:
+			report(f)
+		elif len(compPending) < opts.max_record_findings:
+			compPending.append(f)
+		else:
+			compNotListed = compNotListed + 1
+	if opts.fail_fast:
+		raise StopValidation("Stopped at the first compliance error")
+	checkErrorLimit()
 
+#
+# A record is about to be verified - send on the findings made while
+# reading it.
+#
 def spewCompliance():
-	global compString
-	global qsoInfo
-	global compFile
+	for f in compPending:
+		f.qso = qsoKey
+		report(f)
+	del compPending[:]
+	notListed(qsoKey)
+	for sink in sinks:
+		sink.record(qsoKey, qso)
 
-	if compString == "":
+#
+# A record was thrown away or never finished - send on the findings made
+# while reading it, with the line it started on.
+#
+def spewIncomplete():
+	if not compPending:
 		return
+	if recordStart >= 0:
+		line = lineAt(recordStart)
+	else:
+		line = compPending[0].line()
+	for f in compPending:
+		report(f)
+	del compPending[:]
+	notListed(None)
+	for sink in sinks:
+		sink.incomplete(line)
 
-	if qsoInfo != '':
-		compFile.write (qsoInfo)
-		if opts.html:
-			compFile.write("<br />")
-		compFile.write("\n")
-	compFile.write(compString)
-	compString = ""
+#
+# A record with more than --max-record-findings compliance errors gets the
+# rest as a count, so its findings don't have to be held until its EOR.
+#
+def notListed(key):
+	global compNotListed
+	if compNotListed:
+		report(Finding('FINDINGS_NOT_LISTED', adifPos, (compNotListed,), None, None, 'compliance', key))
+		compNotListed = 0
 
-def consistencyError(msg, line):
+def consistencyError(rule, pos, *args, tag=None, value=None):
 	global consErrors
-	global consFile
-	global qsoInfo
-	if not 'cons' in suppressions:
-		if opts.html:
-			consFile.write("<h3>The following messages represent issues where the QSOs in the submitted ADIF file are compliant with the ADIF standard, but have inconsistent details such as invalid Country, Zones, etc. These findings do not indicate any structural issues with the submitted ADIF file, but they do indicate potentially incorrect records for the QSO being analyzed.</h3>\n")
-		else:
-			consFile.write("The following messages represent issues where the QSOs in the submitted ADIF file are compliant\nwith the ADIF standard, but have inconsistent details such as invalid Country, Zones, etc.\nThese findings do not indicate any structural issues with the submitted ADIF file,\nbut they do indicate potentially incorrect records for the QSO being analyzed.\n")
-		suppressions['cons'] = True
-	if qsoInfo != '':
-		consFile.write (qsoInfo)
-		if opts.html:
-			consFile.write("<br />")
-		consFile.write("\n")
-	consFile.write("Consistency error on line %d: %s" % (line, msg))
-	if opts.html:
-		consFile.write("<br />")
-	consFile.write("\n")
-	qsoInfo = ''
+	if rule in skipRules:
+		return
 	consErrors = consErrors + 1
+	if profiling:
+		countFinding(rule)
+	if sinks:
+		report(Finding(rule, pos, args, tag, value, 'consistency', qsoKey))
+	checkErrorLimit()
+
+#
+# --profile and --stats charge wall and CPU time to the phase the run is
+# in.  The functions below are wrapped to enter their phase and return to
+# the caller's when they are done, verifyQSO() enters a phase for each
+# check, and whatever is left is the tokenizer's.  Findings are counted by
+# rule and by the phase that made them, and the time between the ends of
+# records goes into a histogram of powers of two microseconds.
+#
+# Only functions called once a field or less often are wrapped - timing
+# getByte() or asciiRange() would cost more than the work they do, so
+# reading and decoding a byte at a time stays in the tokenizer's time.
+#
+profiledFunctions = {
+	'indexBuffer' : 'read',
+	'parseDataEvents' : 'decode',
+	'verifyTag' : 'verifyTag',
+	'verifyQSO' : 'verifyQSO',
+	'report' : 'report',
+	'spewCompliance' : 'report',
+	'endRun' : 'report',
+	'lineAt' : 'lines',
+}
+profilePhases = ['setup', 'read', 'decode', 'tokenize', 'verifyTag', 'verifyQSO'] + ['qso:' + check for check in qsoChecks] + ['report', 'lines']
+unprofiled = {}
+profiling = False
+HISTOGRAM_BUCKETS = 32
+SLOW_RECORDS = 10
+
+def profiled(name, fn):
+	def timed(*args):
+		previous = profileEnter(name)
+		try:
+			return fn(*args)
+		finally:
+			profileLeave(previous)
+	return timed
+
+def startProfile():
+	global profiling
+	global phase
+	global phaseTimes
+	global phaseWall
+	global phaseCPU
+	global ruleCounts
+	global recordTimes
+	global slowRecords
+	global recordClock
+	profiling = opts.profile or opts.stats is not None
+	for name in profiledFunctions:
+		fn = unprofiled.setdefault(name, globals()[name])
+		if profiling:
+			fn = profiled(profiledFunctions[name], fn)
+		globals()[name] = fn
+	phaseTimes = {}
+	for name in profilePhases:
+		phaseTimes[name] = [0.0, 0.0, 0, 0]
+	ruleCounts = {}
+	recordTimes = [0] * HISTOGRAM_BUCKETS
+	slowRecords = []
+	phase = 'setup'
+	phaseWall = time.perf_counter()
+	phaseCPU = time.process_time()
+	recordClock = phaseWall
+
+def profileLeave(name):
+	global phase
+	global phaseWall
+	global phaseCPU
+	wall = time.perf_counter()
+	cpu = time.process_time()
+	times = phaseTimes[phase]
+	times[0] = times[0] + wall - phaseWall
+	times[1] = times[1] + cpu - phaseCPU
+	phaseWall = wall
+	phaseCPU = cpu
+	previous = phase
+	phase = name
+	return previous
+
+def profileEnter(name):
+	phaseTimes[name][2] = phaseTimes[name][2] + 1
+	return profileLeave(name)
+
+def countFinding(rule):
+	ruleCounts[rule] = ruleCounts.get(rule, 0) + 1
+	phaseTimes[phase][3] = phaseTimes[phase][3] + 1
+
+def timeRecord():
+	global recordClock
+	now = time.perf_counter()
+	spent = now - recordClock
+	recordClock = now
+	bucket = min(int(spent * 1000000).bit_length(), HISTOGRAM_BUCKETS - 1)
+	recordTimes[bucket] = recordTimes[bucket] + 1
+	if len(slowRecords) < SLOW_RECORDS:
+		heapq.heappush(slowRecords, (spent, recordStart))
+	elif spent > slowRecords[0][0]:
+		heapq.heapreplace(slowRecords, (spent, recordStart))
+
+def profileSummary(size):
+	profileLeave(phase)
+	wall = sum(times[0] for times in phaseTimes.values())
+	cpu = sum(times[1] for times in phaseTimes.values())
+	Info("Profile: %-14s %9s %9s %6s %10s %9s" % ('phase', 'wall s', 'CPU s', 'wall%', 'calls', 'findings'))
+	for name in profilePhases:
+		(spent, used, calls, found) = phaseTimes[name]
+		if spent == 0.0 and calls == 0:
+			continue
+		Info("Profile: %-14s %9.3f %9.3f %5.1f%% %10d %9d" % (name, spent, used, 100.0 * spent / (wall or 1), calls, found))
+	Info("Profile: %-14s %9.3f %9.3f %5.1f%%" % ('total', wall, cpu, 100.0))
+	Info("Profile: %.1f MB at %.2f MB/s, %d QSOs at %.0f QSOs/s" % (size / 1048576.0, size / 1048576.0 / (wall or 1), qsos, qsos / (wall or 1)))
+
+#
+# The --stats counters as a dictionary, ready for json.dump().  The log
+# must still be open, to find the lines of the slowest records.
+#
+def runStats(size):
+	profileLeave(phase)
+	phases = {}
+	for name in profilePhases:
+		(spent, used, calls, found) = phaseTimes[name]
+		phases[name] = {'seconds': spent, 'cpu_seconds': used, 'calls': calls, 'findings': found}
+	histogram = []
+	for bucket in range(HISTOGRAM_BUCKETS):
+		if recordTimes[bucket]:
+			histogram.append({'under_us': 1 << bucket, 'records': recordTimes[bucket]})
+	slowest = []
+	for (spent, start) in sorted(slowRecords, reverse=True):
+		slowest.append({'line': lineAt(start), 'offset': start, 'seconds': spent})
+	return {'file': opts.input_file, 'bytes': size, 'qsos': qsos, 'errors': compErrors + consErrors,
+		'seconds': sum(times[0] for times in phaseTimes.values()),
+		'phases': phases, 'rules': dict(sorted(ruleCounts.items())),
+		'records': {'histogram': histogram, 'slowest': slowest}}
+
+#
+# Progress on stderr, from how far into the log the parser is.  On a
+# terminal the line is rewritten in place.
+#
+def startProgress(size):
+	global progressSize
+	global progressStart
+	global progressLast
+	progressSize = size
+	progressStart = time.monotonic()
+	progressLast = progressStart
+
+def showProgress(final=False):
+	global progressLast
+	now = time.monotonic()
+	if not final and now - progressLast < PROGRESS_INTERVAL:
+		return
+	progressLast = now
+	elapsed = now - progressStart
+	done = adifPos
+	line = "%.1f/%.1f MB (%.0f%%), %d QSOs" % (done / 1048576.0, progressSize / 1048576.0, 100.0 * done / (progressSize or 1), qsos)
+	if elapsed > 0:
+		line = line + ", %.0f QSOs/s" % (qsos / elapsed)
+	line = line + ", %d errors" % (compErrors + consErrors)
+	if final:
+		line = line + ", %.1fs" % (elapsed)
+	elif done > 0:
+		left = elapsed * (progressSize - done) / done
+		line = line + ", %d:%02d left" % (left // 60, left % 60)
+	if sys.stderr.isatty():
+		sys.stderr.write("\r%-79s" % (line))
+		if final:
+			sys.stderr.write("\n")
+	else:
+		sys.stderr.write(line + "\n")
+	sys.stderr.flush()
+
+#
+# --memstats.  The adiftags tables are loaded before the options are read,
+# so they are measured by walking them; everything after is traced with
+# tracemalloc, and a snapshot is taken when parsing ends, before the
+# report sinks are closed.
+#
+def deepSize(obj, seen):
+	if id(obj) in seen:
+		return 0
+	seen.add(id(obj))
+	size = sys.getsizeof(obj)
+	if isinstance(obj, dict):
+		for key in obj:
+			size = size + deepSize(key, seen) + deepSize(obj[key], seen)
+	elif isinstance(obj, (list, tuple, set)):
+		for item in obj:
+			size = size + deepSize(item, seen)
+	return size
+
+def startMemstats():
+	global memBase
+	tracemalloc.start()
+	memBase = tracemalloc.get_traced_memory()[0]
+
+def takeMemstats():
+	global memSnapshot
+	global memTraced
+	memTraced = tracemalloc.get_traced_memory()
+	memSnapshot = tracemalloc.take_snapshot()
+	tracemalloc.stop()
+
+def memSummary():
+	MB = 1048576.0
+	if resource is not None:
+		rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+		if sys.platform != 'darwin':	# Linux reports kilobytes
+			rss = rss * 1024
+		Info("Memory: peak RSS %.1f MB" % (rss / MB))
+	seen = set()
+	tables = 0
+	for table in (dataTypes, myDataTypes, headerTags, qsoTags, enumerations, pas, sas, ranges):
+		tables = tables + deepSize(table, seen)
+	Info("Memory: %.1f MB in the ADIF reference tables" % (tables / MB))
+	(current, peak) = memTraced
+	Info("Memory: %.1f MB allocated during the run, %.1f MB still held when parsing ended" % ((peak - memBase) / MB, (current - memBase) / MB))
+	subsystems = {}
+	for stat in memSnapshot.statistics('filename'):
+		name = memSubsystems.get(os.path.basename(stat.traceback[0].filename), 'other')
+		subsystems[name] = subsystems.get(name, 0) + stat.size
+	for name in sorted(subsystems, key=subsystems.get, reverse=True):
+		Info("Memory: %10.1f KB %s" % (subsystems[name] / 1024.0, name))
+	for stat in memSnapshot.statistics('lineno')[:MEM_TOP_LINES]:
+		frame = stat.traceback[0]
+		Info("Memory: %10.1f KB in %d blocks at %s:%d" % (stat.size / 1024.0, stat.count, os.path.basename(frame.filename), frame.lineno))
+	if qsos > 0:
+		Info("Memory: %.1f bytes held per QSO" % ((current - memBase) / qsos))
 
 def Info(msg):
 	global infoMsg
-	if opts.html:
+	if infoLog is not None:
+		infoLog.append(msg)
+		infoMsg = infoMsg + 1
+		return
+	if opts.format == 'ndjson':
+		sys.stderr.write("Informational: %s\n" % msg)
+	elif opts.html:
 		print("Informational: %s<br />" % msg)
 	else:
 		print("Informational: %s" % msg)
@@ -125,14 +740,14 @@ def hasValidCallSignChars(call):
 
 def checkCallSign(call):
 	if not hasValidCallSignChars(call):
-		complianceError("'%s' is not an amateur callsign as it has unexpected characters" % (call), adifLine)
+		complianceError('CALL_CHARACTERS', adifPos, call)
 		return False
 	if len(call) < 3:
-		complianceError("'%s' is not an amateur callsign - it's too short" % (call) , adifLine)
+		complianceError('CALL_TOO_SHORT', adifPos, call)
 		return False
 	# No leading or trailing /
 	if call[0] == '/' or call[-1:] == '/':
-		complianceError("'%s' is not a plausible amateur callsign" % (call), adifLine)
+		complianceError('CALL_IMPLAUSIBLE', adifPos, call)
 		return False
 	return True
 
@@ -145,24 +760,23 @@ def verifyTag(tag, value, len, type):
 		if len.isnumeric():
 			len = int(len)
 		else:
-			complianceError("length field '%s' is not numeric" % (len), adifLine)
-
+			complianceError('LENGTH_NOT_NUMERIC', adifPos, len, tag=tag)
 	if not tag in qsoTags:			# Tag does not exist
 		return
 	tagType = qsoTags[tag]
 
 	if type != '' and type != tagType:
-		complianceError("tag '%s' specifies type '%s' but is expected to be '%s'" % (tag, type, tagType), adifLine)
+		complianceError('TYPE_MISMATCH', adifPos, tag, type, tagType)
 	if tagType == 'B':			# Boolean
 		if value != 'Y' and value != 'N':
-			complianceError ("tag '%s' should be 'Y' or ''N but is '%s'" % (tag, value), adifLine)
+			complianceError('NOT_BOOLEAN', adifPos, tag, value)
 		return
 	if tagType == 'N' or tagType == 'P':			# Number
 		if not value.isnumeric():
 			try:
 				number = float(value)
 			except ValueError:
-				complianceError ("tag '%s' should be a number but is '%s'" % (tag, value), adifLine)
+				complianceError('NOT_NUMBER', adifPos, tag, value)
 				return
 		else:
 			number = int(value)
@@ -170,35 +784,30 @@ def verifyTag(tag, value, len, type):
 			low = ranges[tag][0]
 			high = ranges[tag][1]
 			if int(number) < low or int(number) > high:
-				complianceError("tag '%s' should be in the range %d to %d but is %s" % (tag, low, high, value), adifLine)
+				complianceError('OUT_OF_RANGE', adifPos, tag, low, high, value)
 				return
 		if tagType == 'P':
 			if not int(number) > 0:
-				complianceError("tag '%s' should be a positive number but has '%s'" % (tag, value), adifLine)
-				return
-			nbr = int(value)
-			if not nbr > 0:
-				complianceErrror("[ERROR] Line %d: tag '%s' should be a positive number but has '%s'" % (adifLine, tag, value))
+				complianceError('NOT_POSITIVE', adifPos, tag, value)
 				return
 		return
 
 	if tagType == 'D':			# Date
 		if len != 8:
-			complianceError ("'%s' should be a date but is %d characters long, not 8" % (tag, len), adifLine)
+			complianceError('DATE_LENGTH', adifPos, tag, len, value=value)
 		if value[:4] < '1900' or value[:4] > '2100':
-			complianceError ("tag '%s' should be a date but '%s' has an invalid year" % (tag, value), adifLine)
+			complianceError('DATE_YEAR', adifPos, tag, value)
 		if value[4:6] < '01' or value [4:6] > '12':
-			complianceError ("tag '%s' value '%s' should be a date but has an invalid month '%s'" % (tag, value, value[4:5]), adifLine)
+			complianceError('DATE_MONTH', adifPos, tag, value, value[4:5])
 		if value[6:8] < '01' or value [6:8] > '31':
-			complianceError ("tag '%s' value '%s' should be a date but has invalid day" % (tag, value), adifLine)
+			complianceError('DATE_DAY', adifPos, tag, value)
 		return
 
 	if tagType == 'T':			# Time
 		if not value.isnumeric():
-			complianceError ("tag '%s' should be a time but'%s' is not numeric" % (tag, value), tagLine)
-
+			complianceError('TIME_NOT_NUMERIC', adifPos, tag, value)
 		if len != 4 and len != 6:
-			complianceError ("tag '%s' should be a time but it is %d characters long not 4 or 6" % (tag, len), adifLine)
+			complianceError('TIME_LENGTH', adifPos, tag, len, value=value)
 		return
 
 	if tagType == 'S' or tagType == 'M':
@@ -206,52 +815,52 @@ def verifyTag(tag, value, len, type):
 
 	if tagType == 'L':			# Location "XDDD MM.MMM format"
 		if len != 11:
-			complianceError ("tag '%s' should be 11 characters long but is %d" % (tag, len), adifLine)
+			complianceError('LOCATION_LENGTH', adifPos, tag, len, value=value)
 		nsew = value[:1]
 		if nsew not in [ 'N', 'S', 'E', 'W' ]:
-			complianceError("Location '%s' value '%s' does not start with N,S,E, or W." % (tag, value), adifLine)
+			complianceError('LOCATION_DIRECTION', adifPos, tag, value)
 		deg = value[1:4]
 		if not deg.isnumeric():
-			complianceError ("Location '%s' value '%s' degrees is not numeric" % (tag, value), adifLine)
+			complianceError('LOCATION_DEGREES', adifPos, tag, value)
 		else:
 			intdeg = int(deg)
 			if intdeg < 0 or intdeg > 180:
-				complianceError ("Location '%s' value '%s' degrees is not in range 0 through 180" % (tag, value), adifLine)
+				complianceError('LOCATION_DEGREES_RANGE', adifPos, tag, value)
 		mins = value[5:7]
 		if not mins.isnumeric():
-			complianceError("Location '%s' value '%s' minutes is not numeric" % (tag, value), adifLine)
+			complianceError('LOCATION_MINUTES', adifPos, tag, value)
 		else:
 			intmins = int(mins)
 			if intmins < 0 or intmins > 59:
-				complianceError ("Location '%s' value '%s' minutes is not in range 0 through 59" % (tag, value), adifLine)
+				complianceError('LOCATION_MINUTES_RANGE', adifPos, tag, value)
 		secs = value[8:11]
 		if not secs.isnumeric():
-			complianceError ("Location '%s' value '%s' seconds is not numeric" % (tag, value), adifLine)
+			complianceError('LOCATION_SECONDS', adifPos, tag, value)
 		else:
 			intsecs = int(secs)
 			if intsecs < 0 or intsecs > 999:
-				complianceError ("Location '%s' value '%s' seconds is not in range 0 through 999" % (tag, value), adifLine)
+				complianceError('LOCATION_SECONDS_RANGE', adifPos, tag, value)
 		return
 
 	if tagType == 'E':		# enumeration
 		if not enumerations[tag]:
-			complianceError("tag '%s' does not have any enumerations - internal error!" % (tag), adifLine)
+			complianceError('NO_ENUMERATIONS', adifPos, tag)
 			return
 
 		if len > 0 and value not in enumerations[tag]:
-			complianceError("The tag '%s' has an invalid value '%s' - not in the enumerations" % (tag, value), adifLine)
+			complianceError('NOT_ENUMERATED', adifPos, tag, value)
 		return
 
 	if len > 0 and tagType == 'R':		# Internal IOTA
 		if len != 6:
-			complianceError ("'%s' value '%s' is not 6 characters" % (tag, value), adifLine)
+			complianceError('IOTA_LENGTH', adifPos, tag, value)
 		cont = value[0:2]
 		if cont not in [ 'NA', 'SA', 'EU', 'AF', 'OC', 'AS', 'AN' ]:
-			complianceError ("'%s' value '%s' isn't a valid continent" % (tag, value), adifLine)
+			complianceError('IOTA_CONTINENT', adifPos, tag, value)
 		if value[2:3] != '-':
-			complianceError ("'%s' value '%s' does not have a hyphen" % (tag, value), adifLine)
+			complianceError('IOTA_HYPHEN', adifPos, tag, value)
 		if not value[3:7].isnumeric():
-			complianceError ("'%s' value '%s' does not have a number after the hyphen" % (tag, value), adifLine)
+			complianceError('IOTA_NUMBER', adifPos, tag, value)
 		return
 
 	if tagType == 'R':		# empty
@@ -261,28 +870,28 @@ def verifyTag(tag, value, len, type):
 		checkCallSign(value)
 		return
 
-	complianceError("Internal failure to handle tag '%s' type '%s'" % (tag, tagType), adifLine)
+	complianceError('UNHANDLED_TYPE', adifPos, tag, tagType)
 	return
 
-def verifyGrid(adifLine, grid):
+def verifyGrid(tag, pos, grid):
 	grid = grid.upper()
 	if len(grid) < 4:
-		complianceError("'%s' is an invalid gridsquare" % (grid), adifLine)
+		complianceError('BAD_GRID', pos, grid, tag=tag)
 		return False
 	if grid[1] < 'A' or grid[1] > 'R':
-		complianceError("'%s' is an invalid gridsquare" % (grid), adifLine)
+		complianceError('BAD_GRID', pos, grid, tag=tag)
 		return False
 	if grid[2] < '0' or grid[2] > '9':
-		complianceError("'%s' is an invalid gridsquare" % (grid), adifLine)
+		complianceError('BAD_GRID', pos, grid, tag=tag)
 		return False
 	if grid[3] < '0' or grid[3] > '9':
-		complianceError("'%s' is an invalid gridsquare" % (grid), adifLine)
+		complianceError('BAD_GRID', pos, grid, tag=tag)
 		return False
 	if len(grid) > 4 and (grid[4] < 'Z' and grid[4] > 'X'):
-		complianceError("'%s' is an invalid gridsquare (subsquare)" % (grid), adifLine)
+		complianceError('BAD_SUBSQUARE', pos, grid, tag=tag)
 		return False
 	if len(grid) > 5 and (grid[5] < 'Z' and grid[4] > 'X'):
-		complianceError("'%s' is an invalid gridsquare (subsquare)" % (grid), adifLine)
+		complianceError('BAD_SUBSQUARE', pos, grid, tag=tag)
 		return False
 	if len(grid) == 4 or len(grid) >= 6:
 		return True
@@ -290,15 +899,15 @@ def verifyGrid(adifLine, grid):
 		return False
 
 def getTag(tagName):
-	if tagName in tagLines:
-		tagLine = tagLines[tagName]
+	if tagName in tagPos:
+		pos = tagPos[tagName]
 	else:
-		tagLine = adifLine
+		pos = adifPos
 	if tagName in qso:
 		val = qso[tagName].strip().upper().strip()
 		if val != '':
-			return (True, val, tagLine)
-	return (False, '', adifLine)
+			return (True, val, pos)
+	return (False, '', adifPos)
 
 def entityName(ent):
 	if ent not in enumerations['DXCC']:
@@ -326,7 +935,7 @@ def fixCounty(cnty):
 	cnty = cnty.replace('CITYANDBOROUGH', '')
 	return cnty
 
-def verifyCounty(tag, adifLine, dxcc, state, cnty):
+def verifyCounty(tag, pos, dxcc, state, cnty):
 	origcnty = cnty
 	cnty = fixCounty(cnty)
 	# 
@@ -340,481 +949,946 @@ def verifyCounty(tag, adifLine, dxcc, state, cnty):
 	cnty = ct
 
 	if st != '' and st != state:
-		consistencyError("%s value of '%s' specifies state '%s' but the STATE is set to '%s'" % (tag, origcnty, st, state), adifLine)
+		consistencyError('COUNTY_STATE', pos, tag, origcnty, st, state)
 	#
 	# Now, try a lookup
 	#
 	if not state in sas or not cnty in sas[state]:
-		consistencyError("%s value of '%s' is not valid for DXCC %s (%s) and STATE '%s'" % (tag, cnty, dxcc, entityName(dxcc), state), adifLine)
+		consistencyError('BAD_COUNTY', pos, tag, cnty, dxcc, entityName(dxcc), state)
 	return
 
 def makeQSOinfo():
-	global qsoInfo
-	qsoInfo = ''
-	(ok, call, tl) = getTag('CALL')
-	if ok:
-		if opts.html:
-			qsoInfo = '\n<br /><b>For the QSO with ' + call
-		else:
-			qsoInfo = '\nFor the QSO with ' + call
-
-	(ok, qso_date, tl) = getTag('QSO_DATE')
-	if ok:
-		if len(qso_date) == 8:
-			qso_date = qso_date[:4] + '-' + qso_date[4:6] + '-' + qso_date[6:8]
-
-		if qsoInfo != '':
-			qsoInfo = qsoInfo + ' on '
-		else:
-			if opts.html:
-				qsoInfo = '\n<br /><b>For the qso on '
-			else:
-				qsoInfo = '\nFor the qso on '
-		qsoInfo = qsoInfo + qso_date
-
+	global qsoKey
+	qsoKey = {}
+	qsoKey['call'] = getTag('CALL')[1]
+	qsoKey['qso_date'] = getTag('QSO_DATE')[1]
+	qsoKey['time_on'] = getTag('TIME_ON')[1]
 	(ok, band, tl) = getTag('BAND')
-	if ok:
-		if qsoInfo != '':
-			qsoInfo = qsoInfo + ' '
-		qsoInfo = qsoInfo + band
-	else:
-		(ok, freq, tl) = getTag('FREQ')
-		if ok:
-			if qsoInfo != '':
-				qsoInfo = qsoInfo + ' '
-			qsoInfo = qsoInfo + freq
-
-	(ok, mode, tl) = getTag('MODE')
-	if ok:
-		if qsoInfo != '':
-			qsoInfo = qsoInfo + ' '
-		qsoInfo = qsoInfo + mode
-	qsoInfo = qsoInfo + ':'
-	if opts.html:
-		qsoInfo = qsoInfo + "</b>"
+	qsoKey['band'] = band
+	if not ok:
+		qsoKey['freq'] = getTag('FREQ')[1]
+	qsoKey['mode'] = getTag('MODE')[1]
 	return
 #
 # Check the QSO for validity.
 #
 def verifyQSO():
-
-	makeQSOinfo()
-	spewCompliance()
 	err = 0
 #
 # Grids look good?
 #
-	(ok, grid, tl) = getTag('GRIDSQUARE')
+	if runChecks['grids']:
+		if profiling:
+			profileEnter('qso:grids')
+		(ok, grid, tl) = getTag('GRIDSQUARE')
 
-	if ok:
-		if not verifyGrid(tl, grid):
-			err + err + 1
+		if ok:
+			if not verifyGrid('GRIDSQUARE', tl, grid):
+				err + err + 1
 
-	(ok, my_gridsquare, tl) = getTag('MYGRIDSQUARE')
-	if ok:
-		if not verifyGrid(tl, my_gridsquare):
-			err + err + 1
+		(ok, my_gridsquare, tl) = getTag('MYGRIDSQUARE')
+		if ok:
+			if not verifyGrid('MYGRIDSQUARE', tl, my_gridsquare):
+				err + err + 1
 
-	(ok, vucc_grids, tl) = getTag('VUCC_GRIDS')
-	if ok:
-		grids = vucc_grids.split(',')
-		for grid in grids:
-			if not verifyGrid(tl, grid):
-				err = err + 1
+		(ok, vucc_grids, tl) = getTag('VUCC_GRIDS')
+		if ok:
+			grids = vucc_grids.split(',')
+			for grid in grids:
+				if not verifyGrid('VUCC_GRIDS', tl, grid):
+					err = err + 1
 
-	(ok, my_vucc_grids, tl) = getTag('MY_VUCC_GRIDS')
-	if ok:
-		grids = my_vucc_grids.split(',')
-		for grid in grids:
-			if not verifyGrid(tl, grid):
-				err = err + 1
+		(ok, my_vucc_grids, tl) = getTag('MY_VUCC_GRIDS')
+		if ok:
+			grids = my_vucc_grids.split(',')
+			for grid in grids:
+				if not verifyGrid('MY_VUCC_GRIDS', tl, grid):
+					err = err + 1
 #
 # Band was already checked to be "correct" so don't need to re-report
 #
-	freqs = []
-	(bandok, band, band_tl) = getTag('BAND')
-	if band not in enumerations['BAND']:
-		bandok = False
-	if bandok:
-		freqs = enumerations['BAND'][band.upper()]
-		low = float(freqs[0])
-		high = float(freqs[1])
-
-	(freqok, freq, freq_tl) = getTag('FREQ')
-	if freqok:
-		if not freq.isnumeric():
-			try:
-				mhz = float(freq)
-			except ValueError:
-				freqok = False
-		else:
-			mhz = int(freq)
-		if bandok and freqok and (mhz < low or mhz > high):		# the list has low/hign range
-			consistencyError("Frequency '%s' is out of range for band '%s'" % (freq, band), freq_tl)
-			freq_ok = False
-
-	if not bandok and not freqok:
-		consistencyError("QSO does not have a band or a frequency specified", adifLine)
-
-	(band_rx_ok, band_rx, band_tl) = getTag('BAND_RX')
-	if band_rx_ok:
-		freqs_rx = enumerations['BAND_RX'][band.upper()]
-		low_rx = float(freqs_rx[0])
-		high_rx = float(freqs_rx[1])
-	(freq_rx_ok, freq_rx, freq_tl) = getTag('FREQ_RX')
-	if freq_rx_ok:
-		if not freq_rx.isnumeric():
-			try:
-				mhz_rx = float(freq_rx)
-			except ValueError:
-				freq_rx_ok = False
-		else:
-			mhz_rx = int(freq_rx)
-		if freq_rx_ok and band_rx_ok and (mhz_rx < low_rx or mhz_rx > high_rx):		# the list has low/hign range
-			consistencyError("RX Frequency '%s' is out of range for band '%s'" % (freq, band), freq_tl)
+	if runChecks['band']:
+		if profiling:
+			profileEnter('qso:band')
+		freqs = []
+		(bandok, band, band_tl) = getTag('BAND')
+		if band not in enumerations['BAND']:
+			bandok = False
+		if bandok:
+			freqs = enumerations['BAND'][band.upper()]
+			low = float(freqs[0])
+			high = float(freqs[1])
+
+		(freqok, freq, freq_tl) = getTag('FREQ')
+		if freqok:
+			if not freq.isnumeric():
+				try:
+					mhz = float(freq)
+				except ValueError:
+					freqok = False
+			else:
+				mhz = int(freq)
+			if bandok and freqok and (mhz < low or mhz > high):		# the list has low/hign range
+				consistencyError('FREQ_OUT_OF_BAND', freq_tl, freq, band)
+				freq_ok = False
+
+		if not bandok and not freqok:
+			consistencyError('NO_BAND', adifPos)
+		(band_rx_ok, band_rx, band_tl) = getTag('BAND_RX')
+		if band_rx_ok:
+			freqs_rx = enumerations['BAND_RX'][band.upper()]
+			low_rx = float(freqs_rx[0])
+			high_rx = float(freqs_rx[1])
+		(freq_rx_ok, freq_rx, freq_tl) = getTag('FREQ_RX')
+		if freq_rx_ok:
+			if not freq_rx.isnumeric():
+				try:
+					mhz_rx = float(freq_rx)
+				except ValueError:
+					freq_rx_ok = False
+			else:
+				mhz_rx = int(freq_rx)
+			if freq_rx_ok and band_rx_ok and (mhz_rx < low_rx or mhz_rx > high_rx):		# the list has low/hign range
+				consistencyError('FREQ_RX_OUT_OF_BAND', freq_tl, freq, band)
 #
 # Is the DXCC and Country OK?
 #
-	(dxccok, dxcc, dxcc_tl) = getTag('DXCC')
-	(countryok, country, cty_tl) = getTag('COUNTRY')
-	if countryok:
-		country = country.upper()
-		if country in entityMap:
-			countrydxcc = entityMap[country]
-		else:
-			countryok = False
-
-	if dxccok and countryok:
-		if countrydxcc != dxcc:
-			consistencyError("The COUNTRY is for DXCC entity %s (%s) but the DXCC tag has %s (%s)" % (countrydxcc, entityName(countrydxcc), dxcc, entityName(dxcc)), cty_Tl)
+	if runChecks['dxcc']:
+		if profiling:
+			profileEnter('qso:dxcc')
+		(dxccok, dxcc, dxcc_tl) = getTag('DXCC')
+		(countryok, country, cty_tl) = getTag('COUNTRY')
+		if countryok:
+			country = country.upper()
+			if country in entityMap:
+				countrydxcc = entityMap[country]
+			else:
+				countryok = False
 
-	if dxccok and dxcc not in enumerations['DXCC']:
-		dxccok = False
+		if dxccok and countryok:
+			if countrydxcc != dxcc:
+				consistencyError('COUNTRY_DXCC', cty_tl, countrydxcc, entityName(countrydxcc), dxcc, entityName(dxcc), value=country)
+		if dxccok and dxcc not in enumerations['DXCC']:
+			dxccok = False
 #
 # Use DXCC entity from the country if not already set
 #
-	if countryok and not dxccok:
-		dxcc = countrydxcc
-		dxccok = True
+		if countryok and not dxccok:
+			dxcc = countrydxcc
+			dxccok = True
 
 # 
 # Repeat for MY_DXCC
 #
-	(my_dxccok, my_dxcc, my_dxcc_tl) = getTag('MY_DXCC')
-	(my_countryok, my_country, my_cty_tl) = getTag('MY_COUNTRY')
-	if my_countryok:
-		my_country = my_country.upper()
-		if my_country in entityMap:
-			my_countrydxcc = entityMap[my_country]
-		else:
-			my_countryok = False
+		(my_dxccok, my_dxcc, my_dxcc_tl) = getTag('MY_DXCC')
+		(my_countryok, my_country, my_cty_tl) = getTag('MY_COUNTRY')
+		if my_countryok:
+			my_country = my_country.upper()
+			if my_country in entityMap:
+				my_countrydxcc = entityMap[my_country]
+			else:
+				my_countryok = False
 
-	if my_dxccok and my_dxcc not in enumerations['DXCC']:
-		my_dxccok = False
+		if my_dxccok and my_dxcc not in enumerations['DXCC']:
+			my_dxccok = False
 
-	if my_dxccok and my_countryok:
-		if my_countrydxcc != my_dxcc:
-			consistencyError ("The MY_COUNTRY is for DXCC entity %s (%s) but the DXCC tag says %s (%s)" % (my_countrydxcc, entityName(my_countrydxcc), dxcc, entityName(my_dxcc)), my_cty_tl)
+		if my_dxccok and my_countryok:
+			if my_countrydxcc != my_dxcc:
+				consistencyError('MY_COUNTRY_DXCC', my_cty_tl, my_countrydxcc, entityName(my_countrydxcc), dxcc, entityName(my_dxcc), value=my_country)
 #
 # Use DXCC entity from the country if not already set
 #
-	if my_countryok and not my_dxccok:
-		my_dxcc = my_countrydxcc
-		my_dxccok = True
+		if my_countryok and not my_dxccok:
+			my_dxcc = my_countrydxcc
+			my_dxccok = True
 #
 # Check the state
 #
-	(stateok, state, state_tl) = getTag('STATE')
-	if stateok:
-		if not dxccok:
-			if state == 'HI':	# OK, it's Hawaii
-				consistencyError ("The QSO contains STATE '%s' but the QSO record has no valid DXCC entity - assuming HAWAII"  % (state), state_tl)
-				dxccok = True
-				dxcc = "110"
-			elif state == 'AK':	# Or Alaska
-				consistencyError ("The QSO contains STATE '%s' but the QSO record has no valid DXCC entity - assuming ALASKA"  % (state), state_tl)
-				dxccok = True
-				dxcc = "6"
-			else:
-				consistencyError ("The QSO contains STATE '%s' but the QSO record has no valid DXCC entity"  % (state), state_tl)
-		elif not dxcc in pas:		# Does this DXCC entity have a primary admin subdivision?
-			consistencyError ("DXCC Entity %s (%s) does not have a primary adminstrative subdivision but the QSO contains STATE '%s'" % (dxcc, entityName(dxcc), state), state_tl)
-			stateok = False
-		else:
-			if state not in pas[dxcc]:
-				consistencyError ("State '%s' is not valid for DXCC %s (%s)" % (state, dxcc, entityName(dxcc)), state_tl)
+	if runChecks['state']:
+		if profiling:
+			profileEnter('qso:state')
+		(stateok, state, state_tl) = getTag('STATE')
+		if stateok:
+			if not dxccok:
+				if state == 'HI':	# OK, it's Hawaii
+					consistencyError('STATE_NO_DXCC_HAWAII', state_tl, state)
+					dxccok = True
+					dxcc = "110"
+				elif state == 'AK':	# Or Alaska
+					consistencyError('STATE_NO_DXCC_ALASKA', state_tl, state)
+					dxccok = True
+					dxcc = "6"
+				else:
+					consistencyError('STATE_NO_DXCC', state_tl, state)
+			elif not dxcc in pas:		# Does this DXCC entity have a primary admin subdivision?
+				consistencyError('STATE_NOT_USED', state_tl, dxcc, entityName(dxcc), state)
 				stateok = False
-
-	(my_stateok, my_state, my_state_tl) = getTag('MY_STATE')
-	if my_stateok:
-		if not my_dxccok:
-			if my_state == 'HI':	# OK, it's Hawaii
-				consistencyError ("The QSO contains MY_STATE '%s' but the QSO record has no valid DXCC entity - assuming HAWAII"  % (my_state), my_state_tl)
-				my_dxccok = True
-				my_dxcc = "110"
-			elif my_state == 'AK':	# Or Alaska
-				consistencyError("The QSO contains MY_STATE '%s' but the QSO record has no valid DXCC entity - assuming ALASKA"  % (my_state), my_state_tl)
-				my_dxccok = True
-				my_dxcc = "6"
 			else:
-				consistencyError("The QSO contains MY_STATE '%s' but the QSO record has no valid DXCC entity"  % (my_state), my_state_tl)
-		elif not my_dxcc in pas:		# Does this DXCC entity have a primary admin subdivision?
-			consistencyError ("DXCC Entity %s (%s) does not have a primary adminstrative subdivision but the QSO contains MY_STATE '%s'" % (my_dxcc, entityName(my_dxcc), my_state), my_state_tl)
-			my_stateok = False
-		else:
-			if my_state not in pas[my_dxcc]:
-				consistencyError ("MY_STATE '%s' is not valid for DXCC %s (%s)" % (my_state, my_dxcc, entityName(my_dxcc)), my_state_tl)
+				if state not in pas[dxcc]:
+					consistencyError('BAD_STATE', state_tl, state, dxcc, entityName(dxcc))
+					stateok = False
+
+		(my_stateok, my_state, my_state_tl) = getTag('MY_STATE')
+		if my_stateok:
+			if not my_dxccok:
+				if my_state == 'HI':	# OK, it's Hawaii
+					consistencyError('MY_STATE_NO_DXCC_HAWAII', my_state_tl, my_state)
+					my_dxccok = True
+					my_dxcc = "110"
+				elif my_state == 'AK':	# Or Alaska
+					consistencyError('MY_STATE_NO_DXCC_ALASKA', my_state_tl, my_state)
+					my_dxccok = True
+					my_dxcc = "6"
+				else:
+					consistencyError('MY_STATE_NO_DXCC', my_state_tl, my_state)
+			elif not my_dxcc in pas:		# Does this DXCC entity have a primary admin subdivision?
+				consistencyError('MY_STATE_NOT_USED', my_state_tl, my_dxcc, entityName(my_dxcc), my_state)
 				my_stateok = False
+			else:
+				if my_state not in pas[my_dxcc]:
+					consistencyError('BAD_MY_STATE', my_state_tl, my_state, my_dxcc, entityName(my_dxcc))
+					my_stateok = False
 
-	(mode_ok, mode, mode_tl) = getTag('MODE')
-
-	submodes = []
-	if not mode_ok:
-		consistencyError("QSO does not have a MODE" % (qsoInfo), mode_tl)
-	else:
-		if mode not in enumerations['MODE']:
-			complianceError("'%s' is not a valid MODE" % (mode), mode_tl)
-			mode_ok = False
-		else:
-			submodes = enumerations['MODE'][mode]
+	if runChecks['mode']:
+		if profiling:
+			profileEnter('qso:mode')
+		(mode_ok, mode, mode_tl) = getTag('MODE')
 
-	(ok, submode, tl) = getTag('SUBMODE')
-	if ok:
+		submodes = []
 		if not mode_ok:
-			complianceError("SUBMODE '%s' without a valid MODE" % (submode), tl)
+			consistencyError('NO_MODE', mode_tl)
 		else:
-			if submode not in submodes:
-				complianceError("'%s' is not a valid SUBMODE for MODE '%s'" % (submode, mode), tl)
+			if mode not in enumerations['MODE']:
+				complianceError('BAD_MODE', mode_tl, mode)
+				mode_ok = False
+			else:
+				submodes = enumerations['MODE'][mode]
+
+		(ok, submode, tl) = getTag('SUBMODE')
+		if ok:
+			if not mode_ok:
+				complianceError('SUBMODE_WITHOUT_MODE', tl, submode)
+			else:
+				if submode not in submodes:
+					complianceError('BAD_SUBMODE', tl, submode, mode)
 #
 # Try to validate COUNTY
 #
-	(ok, cnty, tl) = getTag('CNTY')
+	if runChecks['counties']:
+		if profiling:
+			profileEnter('qso:counties')
+		(ok, cnty, tl) = getTag('CNTY')
 
-	if ok and stateok:
-		verifyCounty('CNTY', tl, dxcc, state, cnty)
+		if ok and stateok:
+			verifyCounty('CNTY', tl, dxcc, state, cnty)
 #
 # Try to validate MY_COUNTY
 #
-	(ok, my_cnty, tl) = getTag('MY_CNTY')
+		(ok, my_cnty, tl) = getTag('MY_CNTY')
 
-	if ok and my_stateok:
-		verifyCounty('MY_CNTY', tl, my_dxcc, my_state, my_cnty)
+		if ok and my_stateok:
+			verifyCounty('MY_CNTY', tl, my_dxcc, my_state, my_cnty)
 #
 # Validate USACA_COUNTIES
 #
-	(ok, usaca, tl) = getTag('USACA_COUNTIES')
+		(ok, usaca, tl) = getTag('USACA_COUNTIES')
 
-	if ok and stateok:
-		for cnty in usaca.split(':'):
-			verifyCounty('USACA_COUNTIES', tl, dxcc, state, cnty)
+		if ok and stateok:
+			for cnty in usaca.split(':'):
+				verifyCounty('USACA_COUNTIES', tl, dxcc, state, cnty)
 
-	(ok, my_usaca, tl) = getTag('MY_USACA_COUNTIES')
+		(ok, my_usaca, tl) = getTag('MY_USACA_COUNTIES')
 
-	if ok and my_stateok:
-		for my_cnty in my_usaca.split(':'):
-			verifyCounty('MY_USACA_COUNTIES', tl, my_dxcc, my_state, my_cnty)
+		if ok and my_stateok:
+			for my_cnty in my_usaca.split(':'):
+				verifyCounty('MY_USACA_COUNTIES', tl, my_dxcc, my_state, my_cnty)
 #
 # Verify zones
 #
-	if dxccok and int(dxcc) > 0:
-		(cqok, cqz, cqz_tl) = getTag('CQZ')
-		(ituok, ituz, ituz_tl) = getTag('ITUZ')
-		if ituok:
-			ituz = int(ituz)
-			zmapsrc = 'DXCC entity'
-			zonemap = enumerations['DXCC'][dxcc]['zonemap']
-			zmapkey = entityName(dxcc)
-			if stateok:
-				if pas[dxcc][state]:
-					zonemap = pas[dxcc][state]
-					zmapsrc = 'STATE'
-					zmapkey = state
-			ok = False
-			for ent in zonemap:
-				(itu, cq) = ent.split(':')
-				if int(itu) == ituz:
-					ok = True
-					break
-			if not ok:
-				consistencyError("ITU Zone '%s' is not correct for the %s '%s'" % (ituz, zmapsrc, zmapkey), ituz_tl)	
-
-		if cqok:
-			cqz = int(cqz)
-			zmapsrc = 'DXCC entity'
-			zonemap = enumerations['DXCC'][dxcc]['zonemap']
-			zmapkey = entityName(dxcc)
-			if stateok:
-				if pas[dxcc][state]:
-					zonemap = pas[dxcc][state]
-					zmapsrc = 'STATE'
-					zmapkey = state
-			ok = False
-			for ent in zonemap:
-				(itu, cq) = ent.split(':')
-				if int(cq) == cqz:
-					ok = True
-					break
-			if not ok:
-				consistencyError("CQ Zone '%s' is not correct for the %s '%s'" % (cqz, zmapsrc, zmapkey), cqz_tl)
-
-	if my_dxccok and int(my_dxcc) > 0:
-		(cqok, cqz, cqz_tl) = getTag('MY_CQZ')
-		(ituok, ituz, ituz_tl) = getTag('MY_ITUZ')
-		if ituok:
-			zmapsrc = 'DXCC entity'
-			zonemap = enumerations['DXCC'][my_dxcc]['zonemap']
-			zmapkey = entityName(my_dxcc)
-			if my_stateok:
-				if pas[my_dxcc][my_state]:
-					zonemap = pas[my_dxcc][my_state]
-					zmapsrc = 'STATE'
-					zmapkey = my_state
-			ok = False
-			for ent in zonemap:
-				(itu, cq) = ent.split(':')
-				if itu == ituz:
-					ok = True
-					break
-			if not ok:
-				consistencyError("MY_ITUZ Zone '%s' is not correct for the %s '%s'" % (ituz, zmapsrc, zmapkey), ituz_tl)
-		if cqok:
-			zmapsrc = 'DXCC entity'
-			zonemap = enumerations['DXCC'][my_dxcc]['zonemap']
-			if my_stateok:
-				if pas[my_dxcc][my_state]:
-					zonemap = pas[my_dxcc][my_state]
-					zmapsrc = 'STATE'
-			ok = False
-			for ent in zonemap:
-				(itu, cq) = ent.split(':')
-				if cq == cqz:
-					ok = True
-					break
-			if not ok:
-				consistencyError("MY_CQZ Zone '%s' is not correct for the %s '%s'" % (cqz, zmapsrc, zmapkey), cqz_tl)	
+	if runChecks['zones']:
+		if profiling:
+			profileEnter('qso:zones')
+		if dxccok and int(dxcc) > 0:
+			(cqok, cqz, cqz_tl) = getTag('CQZ')
+			(ituok, ituz, ituz_tl) = getTag('ITUZ')
+			if ituok:
+				ituz = int(ituz)
+				zmapsrc = 'DXCC entity'
+				zonemap = enumerations['DXCC'][dxcc]['zonemap']
+				zmapkey = entityName(dxcc)
+				if stateok:
+					if pas[dxcc][state]:
+						zonemap = pas[dxcc][state]
+						zmapsrc = 'STATE'
+						zmapkey = state
+				ok = False
+				for ent in zonemap:
+					(itu, cq) = ent.split(':')
+					if int(itu) == ituz:
+						ok = True
+						break
+				if not ok:
+					consistencyError('BAD_ITUZ', ituz_tl, ituz, zmapsrc, zmapkey)
+			if cqok:
+				cqz = int(cqz)
+				zmapsrc = 'DXCC entity'
+				zonemap = enumerations['DXCC'][dxcc]['zonemap']
+				zmapkey = entityName(dxcc)
+				if stateok:
+					if pas[dxcc][state]:
+						zonemap = pas[dxcc][state]
+						zmapsrc = 'STATE'
+						zmapkey = state
+				ok = False
+				for ent in zonemap:
+					(itu, cq) = ent.split(':')
+					if int(cq) == cqz:
+						ok = True
+						break
+				if not ok:
+					consistencyError('BAD_CQZ', cqz_tl, cqz, zmapsrc, zmapkey)
+		if my_dxccok and int(my_dxcc) > 0:
+			(cqok, cqz, cqz_tl) = getTag('MY_CQZ')
+			(ituok, ituz, ituz_tl) = getTag('MY_ITUZ')
+			if ituok:
+				zmapsrc = 'DXCC entity'
+				zonemap = enumerations['DXCC'][my_dxcc]['zonemap']
+				zmapkey = entityName(my_dxcc)
+				if my_stateok:
+					if pas[my_dxcc][my_state]:
+						zonemap = pas[my_dxcc][my_state]
+						zmapsrc = 'STATE'
+						zmapkey = my_state
+				ok = False
+				for ent in zonemap:
+					(itu, cq) = ent.split(':')
+					if itu == ituz:
+						ok = True
+						break
+				if not ok:
+					consistencyError('BAD_MY_ITUZ', ituz_tl, ituz, zmapsrc, zmapkey)
+			if cqok:
+				zmapsrc = 'DXCC entity'
+				zonemap = enumerations['DXCC'][my_dxcc]['zonemap']
+				if my_stateok:
+					if pas[my_dxcc][my_state]:
+						zonemap = pas[my_dxcc][my_state]
+						zmapsrc = 'STATE'
+				ok = False
+				for ent in zonemap:
+					(itu, cq) = ent.split(':')
+					if cq == cqz:
+						ok = True
+						break
+				if not ok:
+					consistencyError('BAD_MY_CQZ', cqz_tl, cqz, zmapsrc, zmapkey)
 #
 # Do we have the basics for a valid QSO? Date, time, mode? (Band/freq already checked)
 #
-	(date_ok, qso_date, tl) = getTag('QSO_DATE')
-	if date_ok:
-		if len(qso_date) != 8 or not qso_date.isnumeric():
-			date_ok = False
-
-	if not date_ok:
-		consistencyError("QSO does not have a valid date", tl)
+	if runChecks['dates']:
+		if profiling:
+			profileEnter('qso:dates')
+		(date_ok, qso_date, tl) = getTag('QSO_DATE')
+		if date_ok:
+			if len(qso_date) != 8 or not qso_date.isnumeric():
+				date_ok = False
 
-	(time_ok, qso_time, tl) = getTag('TIME_ON')
-	if not time_ok:
-		consistencyError("QSO does not have a valid time", tl)
+		if not date_ok:
+			consistencyError('NO_DATE', tl)
+		(time_ok, qso_time, tl) = getTag('TIME_ON')
+		if not time_ok:
+			consistencyError('NO_TIME', tl)
 #
 # TIME_ON after TIME_OFF?
 #
-	(date_off_ok, qso_date_off, tl) = getTag('QSO_DATE_OFF')
-	if not date_off_ok:
-		if date_ok:
-			qso_date_off = qso_date
-		else:
-			qso_date = ''
-			qso_date_off = ''
-	(time_off_ok, qso_time_off, tl) = getTag('TIME_OFF')
-
-	if time_off_ok:
-		if not time_ok:
-			consistencyError("QSO has a TIME_OFF but no TIME_ON", tl)
-		qstart = qso_date + qso_time
-		qend = qso_date_off + qso_time_off
-		if qstart > qend:	# Started after it began?
-			consistencyError("QSO TIME_OFF is %s/%s, which is before the QSO TIME_ON of %s/%s" % (qso_date_off, qso_time_off, qso_date, qso_time), tl)
-
-	if not mode_ok:
-		consistencyError("QSO does not have a valid mode", tl)
+		(date_off_ok, qso_date_off, tl) = getTag('QSO_DATE_OFF')
+		if not date_off_ok:
+			if date_ok:
+				qso_date_off = qso_date
+			else:
+				qso_date = ''
+				qso_date_off = ''
+		(time_off_ok, qso_time_off, tl) = getTag('TIME_OFF')
+
+		if time_off_ok:
+			if not time_ok:
+				consistencyError('TIME_OFF_WITHOUT_ON', tl)
+			qstart = qso_date + qso_time
+			qend = qso_date_off + qso_time_off
+			if qstart > qend:	# Started after it began?
+				consistencyError('TIME_OFF_BEFORE_ON', tl, qso_date_off, qso_time_off, qso_date, qso_time)
+	if runChecks['mode'] and not mode_ok:
+		if profiling:
+			profileLeave('qso:mode')
+		consistencyError('NO_VALID_MODE', mode_tl)
 #
 # Is the QSO in range of valid dates for the entity?
 #
-	isodate = qso_date[:4] + '-' + qso_date[4:6] + '-' + qso_date [6:8] + ' 00:00:00'
-	qdate = getDate(isodate)
-	if dxccok and 'valid' in enumerations['DXCC'][dxcc]:
-		start = getDate(enumerations['DXCC'][dxcc]['valid'])
-		if qdate < start:
-			consistencyError("QSO Date of '%s' is before the valid dates for dxcc %s (%s)" % (qso_date, dxcc, entityName(dxcc)), tl)
-	if dxccok and 'invalid' in enumerations['DXCC'][dxcc]:
-		end = getDate(enumerations['DXCC'][dxcc]['invalid'])
-		if qdate > end:
-			consistencyError("QSO Date of '%s' is after the valid dates for dxcc %s (%s)" % (qso_date, dxcc, entityName(dxcc)), tl)
-	if my_dxccok and (my_dxcc != dxcc):
-		if 'valid' in enumerations['DXCC'][my_dxcc]:
-			start = getDate(enumerations['DXCC'][my_dxcc]['valid'])
+	if runChecks['dates']:
+		if profiling:
+			profileLeave('qso:dates')
+		isodate = qso_date[:4] + '-' + qso_date[4:6] + '-' + qso_date [6:8] + ' 00:00:00'
+		try:
+			qdate = getDate(isodate)
+		except ValueError:			# No date, or not a real one
+			return
+		if dxccok and 'valid' in enumerations['DXCC'][dxcc]:
+			start = getDate(enumerations['DXCC'][dxcc]['valid'])
 			if qdate < start:
-				consistencyError("QSO Date of '%s' is before the valid dates for dxcc %s (%s)" % (qso_date, my_dxcc, entityName(my_dxcc)),  tl)
-		if 'invalid' in enumerations['DXCC'][my_dxcc]:
-			end = getDate(enumerations['DXCC'][my_dxcc]['invalid'])
+				consistencyError('DATE_BEFORE_ENTITY', tl, qso_date, dxcc, entityName(dxcc))
+		if dxccok and 'invalid' in enumerations['DXCC'][dxcc]:
+			end = getDate(enumerations['DXCC'][dxcc]['invalid'])
 			if qdate > end:
-				consistencyError("QSO Date of '%s' is after the valid dates for dxcc %s (%s)" % (qso_date, my_dxcc, entityName(my_dxcc)), tl)
-
+				consistencyError('DATE_AFTER_ENTITY', tl, qso_date, dxcc, entityName(dxcc))
+		if my_dxccok and (my_dxcc != dxcc):
+			if 'valid' in enumerations['DXCC'][my_dxcc]:
+				start = getDate(enumerations['DXCC'][my_dxcc]['valid'])
+				if qdate < start:
+					consistencyError('DATE_BEFORE_ENTITY', tl, qso_date, my_dxcc, entityName(my_dxcc))
+			if 'invalid' in enumerations['DXCC'][my_dxcc]:
+				end = getDate(enumerations['DXCC'][my_dxcc]['invalid'])
+				if qdate > end:
+					consistencyError('DATE_AFTER_ENTITY', tl, qso_date, my_dxcc, entityName(my_dxcc))
 #
 # that's all, folks.
 #
 	return
 
+def nonASCIIError(pos, adifTag):
+	global nonASCII
+	line = lineAt(pos)
+	if nonASCII != line:
+		if adifTag != '':
+			complianceError('NON_ASCII_TAG', pos, adifTag)
+		else:
+			complianceError('NON_ASCII', pos)
+		nonASCII = line
+
 def getByte(file, adifState, adifTag):
 	global nonASCII
+	global adifPos
 
 	byte = file.read(1)
 	if not byte:
 		return None
+	adifPos = adifPos + 1
 	try:
 		inChar = byte.decode('utf-8')
 	except UnicodeDecodeError:
 		if adifState != ADIF_STATE_BEGIN:
-			if nonASCII != adifLine:
-				if adifTag != '':
-					complianceError("Non-ASCII character in input file, tag %s" %adifTag, adifLine)
-				else:
-					complianceError("Non-ASCII character in input file", adifLine)
-				nonASCII = adifLine
+			nonASCIIError(adifPos, adifTag)
 		inChar = ' '
 	if ord(inChar) > 128:
 		if adifState != ADIF_STATE_BEGIN:
-			if nonASCII != adifLine:
+			if nonASCII != lineAt(adifPos):
 				if adifTag != '':
-					complianceError("Non-ASCII character %s in input file, tag %s" % (inChar, adifTag), adifLine)
+					complianceError('NON_ASCII_CHAR_TAG', adifPos, inChar, adifTag)
 				else:
-					complianceError ("Non-ASCII character '%s' in input file" % (inChar), adifLine)
-			nonASCII = adifLine
+					complianceError('NON_ASCII_CHAR', adifPos, inChar)
+			nonASCII = lineAt(adifPos)
 	return inChar
 
-def setTagInQSO(qso, tag, value, line, hdr):
+def setTagInQSO(qso, tag, value, pos, hdr):
 	if tag in qso:
 		if hdr:
-			complianceError("tag '%s' appears more than once in the header, replacing old value %s with new value %s" % (tag, qso[tag], value), line)
+			complianceError('DUPLICATE_HEADER_TAG', pos, tag, qso[tag], value)
 		else:
-			complianceError("tag '%s' appears more than once in a record, replacing old value %s with new value %s" % (tag, qso[tag], value), line)
+			complianceError('DUPLICATE_TAG', pos, tag, qso[tag], value)
 	qso[tag] = value
 
-def main():
+#
+# Stop for cancel() or the time budget.  This is looked at the end of each
+# record, and within a record once it has run on for CHECK_BYTES, so that
+# a log with no EOR stops in time too.
+#
+def checkStop():
+	if cancelled:
+		raise StopValidation("Stopped on request, at byte %d on line %d - the report is truncated" % (adifPos, lineAt(adifPos)))
+	if deadline and time.monotonic() > deadline:
+		raise StopValidation("Stopped at the time budget of %g seconds, at byte %d on line %d - the report is truncated" % (opts.time_budget, adifPos, lineAt(adifPos)))
+
+#
+# Checks made every CHECK_BYTES of the log as tags are read, so that they
+# are made in a log with no EOR or a few huge records as well.
+#
+def periodicChecks():
+	global nextCheck
+	nextCheck = adifPos + CHECK_BYTES
+	if opts.progress:
+		showProgress()
+	if adifPos - recordStart > CHECK_BYTES:
+		checkStop()
+
+#
+# A complete tag has been read - check it and file it in the header or QSO.
+#
+def checkTag(adifTag, adifValue, adifSize, adifType):
+	global inHeader
+	global qso
+	global tagPos
+	global qsos
+	global recordStart
+	global qsoKey
+
+	if recordStart < 0:
+		recordStart = tagStart
+	elif adifPos - recordStart > opts.max_record:
+		if inHeader:
+			complianceError('HEADER_TOO_LONG', adifPos, opts.max_record)
+		else:
+			complianceError('RECORD_TOO_LONG', adifPos, opts.max_record)
+		spewIncomplete()
+		qso = {}
+		tagPos = {}
+		recordStart = tagStart
+		checkStop()
+	if adifPos >= nextCheck:
+		periodicChecks()
+
+	# Ignore app-specific tags
+	if adifTag[:4] == 'APP_':
+		return
+
+	# Handle userdefs
+
+	if adifTag[:7] == 'USERDEF':
+		userNum = adifTag[7:]
+		if userNum.isnumeric():
+			adifTag = "USERDEF"
+			userTags[adifValue] = adifType
+
+	if adifTag != 'EOH' and not opts.structure_only:
+		verifyTag(adifTag, adifValue, adifSize, adifType)
+
+	if not adifTag in qso:
+		setTagInQSO(qso, adifTag, adifValue, adifPos, inHeader)
+
+	tagPos[adifTag] = adifPos
+	if inHeader:
+		if adifTag == 'EOH':
+			inHeader = False
+			headerFields.update(qso)
+			del headerFields['EOH']
+			qso = {}
+			tagPos = {}
+			recordStart = -1
+			if recordIndex is not None:
+				recordIndex.headerEnd = adifPos
+		if not adifTag in headerTags:
+			complianceError('BAD_HEADER_TAG', adifPos, adifTag)
+		if adifTag == 'EOR':
+			complianceError('EOR_IN_HEADER', adifPos)
+	else:
+		if not adifTag in qsoTags and not adifTag in userTags:
+			complianceError('BAD_TAG', adifPos, adifTag, adifValue)
+		if adifTag == 'EOH':
+			complianceError('EOH_IN_RECORD', adifPos)
+	if opts.header_only and not inHeader:
+		raise StopValidation("Stopped at the end of the header")
+	if adifTag == 'EOR':
+		# handle QSO here
+		makeQSOinfo()
+		spewCompliance()
+		if not opts.structure_only and not opts.header_only:
+			verifyQSO()
+		qsoKey = None
+		if profiling:
+			timeRecord()
+		if recordIndex is not None:
+			indexRecord()
+		qso = {}
+		qsos = qsos + 1
+		recordStart = -1
+		if checkpointing:
+			markCheckpoint()
+		checkStop()
+
+#
+# The original character-at-a-time parser, kept as the reference
+# implementation for the fast engine below.
+#
+def parseLegacy(adif, pos=0):
+	global adifPos
+	global badLen
+	global tagStart
+
+	# Reset everything
+	adifTag = ''
+	adifValue = ''
+	adifLen = 0
+	adifSize = '' 
+	adifType = ''
+	adifState = ADIF_STATE_BEGIN
+	adif.seek(pos)
+	adifPos = pos
+	badLen = 0
+	skipTag = False
+
+	while adifState != ADIF_STATE_DONE:
+		if adifState == ADIF_STATE_CHECK:
+			if not skipTag:
+				checkTag(adifTag, adifValue, adifSize, adifType)
+			# reset for next round
+			skipTag = False
+			adifTag = ''
+			adifValue = ''
+			adifLen = 0
+			adifSize = '' 
+			adifType = ''
+			adifState = ADIF_STATE_BEGIN
+			continue
+
+		inChar = getByte(adif, adifState, adifTag)
+		if not inChar:			# EOF
+			break
+
+		if adifState != ADIF_STATE_GET_DATA and adifState != ADIF_STATE_GET_NEWLINE:
+			if inChar == '\n' or inChar == '\r':		# ignore line endings
+				continue
+		# Begin state - just keep reading until you get a '<'.
+		if adifState == ADIF_STATE_BEGIN:
+			if '<' == inChar:		# start of a tag
+				adifState = ADIF_STATE_GET_NAME
+				tagStart = adifPos - 1
+				# The same limit on tag length as the fast engine
+				if adif.find(b'>', tagStart, tagStart + MAX_TAG_HEADER) < 0:
+					if tagStart + MAX_TAG_HEADER >= len(adif):	# EOF in the middle of a tag
+						break
+					adifPos = tagStart + MAX_TAG_HEADER
+					complianceError('TAG_TOO_LONG', adifPos, MAX_TAG_HEADER)
+					adifPos = resync(adif, adifPos, len(adif))
+					adif.seek(adifPos)
+					adifState = ADIF_STATE_BEGIN
+			continue
+
+		# Get the tag name - add chars until '>' or ':' found
+		elif adifState == ADIF_STATE_GET_NAME:
+			if ':' == inChar or '>' == inChar:		# end of tag
+				adifState = ADIF_STATE_GET_SIZE
+				if inChar == '>':			# end of tag, no size
+					adifState = ADIF_STATE_CHECK
+					continue
+			else:
+				adifTag = adifTag + inChar.upper()
+				adifLen = 0
+			continue
+
+		elif adifState == ADIF_STATE_GET_SIZE:
+			if ':' == inChar or '>' == inChar:		# end of size
+				if ':' == inChar:
+					adifState = ADIF_STATE_GET_TYPE
+				else:
+					adifState = ADIF_STATE_GET_DATA
+					if adifLen > opts.max_field:
+						fieldTooLong(adifTag, adifLen)
+						adifPos = resync(adif, adifPos, len(adif))
+						adif.seek(adifPos)
+						adifState = ADIF_STATE_CHECK
+						skipTag = True
+					elif adifLen == 0:			# empty, don't read past the '>'
+						setTagInQSO(qso, adifTag, adifValue, adifPos, inHeader)
+						tagPos[adifTag] = adifPos
+						adifState = ADIF_STATE_CHECK
+			else:
+				adifSize = adifSize + inChar
+				if adifSize.isnumeric():
+					adifLen = int(adifSize)
+					badLen = 0
+				else:
+					complianceError('SIZE_NOT_NUMERIC', adifPos, adifSize, tag=adifTag)
+					badLen = badLen + 1
+					if badLen > opts.max_length_errors:
+						lengthErrors()
+						adifPos = resync(adif, adifPos, len(adif))
+						adif.seek(adifPos)
+						adifState = ADIF_STATE_CHECK
+						skipTag = True
+			continue
+
+		elif adifState == ADIF_STATE_GET_TYPE:
+			if '>' == inChar:						# no explicit type
+				adifState = ADIF_STATE_GET_DATA
+				if adifType != '' and adifType not in dataTypes:
+					complianceError('BAD_DATA_TYPE', adifPos, adifType, tag=adifTag)
+				if adifLen > opts.max_field:
+					fieldTooLong(adifTag, adifLen)
+					adifPos = resync(adif, adifPos, len(adif))
+					adif.seek(adifPos)
+					adifState = ADIF_STATE_CHECK
+					skipTag = True
+				elif adifLen == 0:			# empty, don't read past the '>'
+					setTagInQSO(qso, adifTag, adifValue, adifPos, inHeader)
+					tagPos[adifTag] = adifPos
+					adifState = ADIF_STATE_CHECK
+			else:
+				adifType = adifType + inChar.upper()
+			continue
+
+		elif adifState == ADIF_STATE_GET_DATA:
+			adifValue = adifValue + inChar
+			adifLen = adifLen - 1
+			if inChar == '\n':
+				complianceError('NEWLINE_WITHOUT_RETURN', adifPos, adifTag)
+			if inChar == '\r':
+				adifState = ADIF_STATE_GET_NEWLINE
+			if adifLen == 0:
+				setTagInQSO(qso, adifTag, adifValue, adifPos, inHeader)
+				tagPos[adifTag] = adifPos
+				adifState = ADIF_STATE_CHECK
+			continue
+
+		elif adifState == ADIF_STATE_GET_NEWLINE:
+			adifValue = adifValue + inChar
+			adifLen = adifLen - 1
+			if inChar != '\n':
+				complianceError('RETURN_WITHOUT_NEWLINE', adifPos, adifTag)
+			if adifLen == 0:
+				setTagInQSO(qso, adifTag, adifValue, adifPos, inHeader)
+				tagPos[adifTag] = adifPos
+				adifState = ADIF_STATE_CHECK
+			else:
+				adifState = ADIF_STATE_GET_DATA
+			continue
+
+#
+# Tag headers that are not plain ASCII or have a malformed size are
+# walked a character at a time, exactly as the legacy parser does.
+#
+def parseTagHeader(buf, start, end):
+	global adifPos
+	global badLen
+
+	adifTag = ''
+	adifSize = ''
+	adifType = ''
+	adifLen = 0
+	adifState = ADIF_STATE_GET_NAME
+	for i in range(start + 1, end - 1):
+		adifPos = i + 1
+		if buf[i] > 127:
+			nonASCIIError(adifPos, adifTag)
+			inChar = ' '
+		else:
+			inChar = chr(buf[i])
+		if inChar == '\n' or inChar == '\r':
+			continue
+		if adifState == ADIF_STATE_GET_NAME:
+			if ':' == inChar:
+				adifState = ADIF_STATE_GET_SIZE
+			else:
+				adifTag = adifTag + inChar.upper()
+		elif adifState == ADIF_STATE_GET_SIZE:
+			if ':' == inChar:
+				adifState = ADIF_STATE_GET_TYPE
+			else:
+				adifSize = adifSize + inChar
+				if adifSize.isnumeric():
+					adifLen = int(adifSize)
+					badLen = 0
+				else:
+					complianceError('SIZE_NOT_NUMERIC', adifPos, adifSize, tag=adifTag)
+					badLen = badLen + 1
+					if badLen > opts.max_length_errors:
+						lengthErrors()
+						return None
+		else:
+			adifType = adifType + inChar.upper()
+	adifPos = end
+	return (adifTag, adifSize, adifType, adifLen)
+
+#
+# Limits on hostile input.  Each is reported, then parsing carries on from
+# the next plausible tag instead of buffering the rest of the file.
+#
+def fieldTooLong(adifTag, adifLen):
+	complianceError('FIELD_TOO_LONG', adifPos, adifTag, adifLen, opts.max_field)
+def lengthErrors():
+	global badLen
+	complianceError('LENGTH_ERRORS', adifPos, opts.max_length_errors)
+	badLen = 0
+
+def resync(buf, pos, end):
+	m = resyncRe.search(buf, pos, end)
+	if not m:
+		return end
+	return m.start()
+
+#
+# Report line endings and non-ASCII characters within a data field, in
+# the order the legacy parser would, and return the field as a string.
+#
+def parseDataEvents(data, pos, adifTag):
+	cr = -1
+	for m in dataRe.finditer(data):
+		i = m.start()
+		ch = data[i]
+		if ch > 127:
+			nonASCIIError(pos + i + 1, adifTag)
+		if i == cr:				# character following a Return
+			if ch != 10:
+				complianceError('RETURN_WITHOUT_NEWLINE', pos + i + 1, adifTag)
+			continue
+		if ch == 10:
+			complianceError('NEWLINE_WITHOUT_RETURN', pos + i + 1, adifTag)
+		elif ch == 13 and i < len(data) - 1:
+			cr = i + 1
+			if data[cr] < 128 and data[cr] != 10 and data[cr] != 13:
+				complianceError('RETURN_WITHOUT_NEWLINE', pos + cr + 1, adifTag)
+	return data.translate(asciiTable).decode('ascii')
+
+def decodeName(name):
+	if len(tagNames) >= MAX_TAG_NAMES:
+		tagNames.clear()
+	decoded = name.translate(None, b'\r\n').decode().upper()
+	tagNames[name] = decoded
+	return decoded
+
+#
+# Parse the buffer a tag at a time, searching for '<' and slicing each
+# value by its length rather than looking at every character.
+#
+def parseFast(buf, pos=0, end=None):
+	global adifPos
+	global badLen
+	global tagStart
+
+	if end is None:
+		end = len(buf)
+	badLen = 0
+	asciiStart = 0
+	asciiEnd = 0
+	while True:
+		start = buf.find(b'<', pos, end)
+		if start < 0:
+			break
+		limit = start + MAX_TAG_HEADER
+		if limit > end:
+			limit = end
+		m = tagRe.match(buf, start, limit)
+		if not m:
+			if start + MAX_TAG_HEADER >= end:	# EOF in the middle of a tag
+				break
+			adifPos = start + MAX_TAG_HEADER
+			complianceError('TAG_TOO_LONG', adifPos, MAX_TAG_HEADER)
+			pos = resync(buf, adifPos, end)
+			continue
+		tagStart = start
+		pos = m.end()
+		adifPos = pos
+		(name, size, type) = m.groups()
+		if start < asciiStart or pos > asciiEnd:
+			(asciiStart, asciiEnd) = asciiRange(start, pos)
+		clean = start >= asciiStart and pos <= asciiEnd
+		if (clean or m.group(0).isascii()) and (size is None or size.isdigit()):
+			adifTag = tagNames.get(name)
+			if adifTag is None:
+				adifTag = decodeName(name)
+			adifSize = ''
+			adifType = ''
+			adifLen = 0
+			if size is not None:
+				adifSize = size.decode()
+				adifLen = int(adifSize)
+				badLen = 0
+			if type is not None:
+				adifType = tagNames.get(type)
+				if adifType is None:
+					adifType = decodeName(type)
+		else:
+			header = parseTagHeader(buf, start, pos)
+			if header is None:		# from where the size went bad
+				pos = resync(buf, adifPos, end)
+				continue
+			(adifTag, adifSize, adifType, adifLen) = header
+
+		if size is None:			# end of tag, no size
+			checkTag(adifTag, '', adifSize, adifType)
+			continue
+
+		if adifType != '' and adifType not in dataTypes:
+			complianceError('BAD_DATA_TYPE', adifPos, adifType, tag=adifTag)
+		if adifLen > opts.max_field:
+			fieldTooLong(adifTag, adifLen)
+			pos = resync(buf, pos, end)
+			continue
+
+		data = buf[pos:pos + adifLen]
+		if pos + adifLen > asciiEnd:
+			(asciiStart, asciiEnd) = asciiRange(pos, pos + adifLen)
+			clean = pos >= asciiStart and pos + adifLen <= asciiEnd
+		if not (clean or data.isascii()) or b'\n' in data or b'\r' in data:
+			adifValue = parseDataEvents(data, pos, adifTag)
+		else:
+			adifValue = data.decode('ascii')
+		if pos + adifLen > end:		# EOF in the middle of the data
+			break
+		pos = pos + adifLen
+		adifPos = pos
+		setTagInQSO(qso, adifTag, adifValue, adifPos, inHeader)
+		tagPos[adifTag] = adifPos
+		checkTag(adifTag, adifValue, adifSize, adifType)
+
+#
+# Set up the state for a run: parse the options and open the reports.
+#
+def startRun(args=None):
 	global opts
 	global entityMap
-	global tagLines
+	global tagPos
 	global qso
-	global adifLine
 	global compErrors
-	global compString
 	global consErrors
 	global infoMsg
-	global suppressions
-
-	opts,args = option_parsing()
+	global inHeader
+	global userTags
+	global qsos
+	global nonASCII
+	global tagStart
+	global recordStart
+	global recordIndex
+	global qsoKey
+	global compPending
+	global compNotListed
+	global headerFields
+	global adifPos
+	global deadline
+	global cancelled
+	global checkpointing
+	global nextCheck
+	global infoLog
+	global resumed
+
+	opts,args = option_parsing(args)
+	resumed = None
+	if opts.resume:
+		resumed = loadCheckpoint(opts.resume)
+	cancelled = False
+	checkpointing = opts.checkpoint is not None
+	deadline = 0
+	if opts.time_budget > 0:
+		deadline = time.monotonic() + opts.time_budget
+	selectChecks()
+	startProfile()
 
 	inHeader = True
 	qso = {}
-	tagLines = {}
+	tagPos = {}
 	userTags = {}
 	qsos = 0
 	compErrors = 0
 	consErrors = 0
-	compString = ""
 	infoMsg = 0
-	suppressions = {}
+	infoLog = None
+	nonASCII = -1
+	tagStart = 0
+	recordStart = -1
+	recordIndex = None
+	qsoKey = None
+	compPending = []
+	compNotListed = 0
+	headerFields = {}
+	adifPos = 0
+	nextCheck = 0
 
 	entityMap = {}
 	for key in enumerations['DXCC']:
@@ -827,200 +1901,371 @@ def main():
 	entityMap['UNITED STATES'] = '291'
 	entityMap['GERMANY'] = '230'
 
-	if not opts.input_file:
-		print ("[ERROR] you must specify an input file with -f")
-		sys.exit(1)
+	global sinks
+	global reportFiles
+	reportFiles = []
+	sinks = []
+	#
+	# The main report goes to stdout or -a/-c, and each -o output gets a
+	# sink of its own, all fed from the same pass over the file.
+	#
+	continued = 0
+	if resumed is not None:
+		continued = resumed['line']
+	if not opts.quiet and (not opts.outputs or opts.comp_file or opts.cons_file):
+		compFile = openReport(opts.comp_file)
+		consFile = openReport(opts.cons_file)
+		sinks.append(adifreport.makeSink(opts.format, compFile, consFile, opts.aggregate, continued))
+	for (format, path) in opts.outputs:
+		if format == 'pages':
+			sinks.append(adifreport.HtmlPagesSink(path, opts.page_size))
+			continue
+		if format == 'sqlite':
+			sinks.append(adifreport.SqliteSink(path, opts.input_file or ''))
+			continue
+		out = openReport(path)
+		sinks.append(adifreport.makeSink(format, out, out, opts.aggregate, continued))
 
-	global compFile
-	global consFile
-	if opts.comp_file:
-		compFile = open(opts.comp_file, 'w')
+#
+# Reports named *.gz, or any report file with --compress, are written
+# through gzip as they go, with a large buffer in front of the compressor.
+#
+def openReport(path):
+	if not path:
+		return sys.stdout
+	if opts.compress and not path.endswith('.gz'):
+		path = path + '.gz'
+	if path.endswith('.gz'):
+		out = io.TextIOWrapper(io.BufferedWriter(gzip.open(path, 'wb', compresslevel=6), REPORT_BUFFER))
 	else:
-		compFile = sys.stdout
+		out = open(path, 'w')
+	reportFiles.append(out)
+	return out
+
+def endRun():
+	# Findings from a record that never saw its EOR
+	spewIncomplete()
+	for sink in sinks:
+		sink.close()
+	for out in reportFiles:
+		out.close()
 
-	if opts.cons_file:
-		consFile  = open(opts.cons_file, 'w')
-	else:
-		consFile = sys.stdout
+#
+# A run that ended in an exception from the parser: close the reports
+# without their endings and let go of the log and the findings held, so
+# the next run in this process starts clean.
+#
+def abandonRun():
+	global sinks
+	for out in reportFiles:
+		out.close()
+	del reportFiles[:]
+	sinks = []
+	del compPending[:]
+	indexBuffer(b'')
+
+def indexRecord():
+	(ok, qso_date, tl) = getTag('QSO_DATE')
+	(ok, call, tl) = getTag('CALL')
+	recordIndex.append(recordStart, adifPos - recordStart, lineAt(recordStart), qso_date, call)
 
+#
+# Re-validate single records of a log, found through its record index,
+# and return what was found as validateLog() does.  No report is written
+# unless the options ask for one.
+#
+def validateRecords(logPath, records, args=None, indexPath=None):
+	global inHeader
+	global infoLog
+
+	startRun(['-q'] + (args or []))
+	infoLog = []
+	found = adifreport.ListSink()
+	sinks.append(found)
+	with adifindex.openLog(logPath, indexPath) as log:
+		indexBuffer(log.buf)
+		userTags.update(log.index.userTags)
+		inHeader = False
+		stopped = None
+		try:
+			for n in records:
+				(start, end) = log.span(n)
+				parseFast(log.buf, start, end)
+		except StopValidation as stop:
+			stopped = str(stop)
+		endRun()
+	return {'qsos': qsos, 'errors': compErrors + consErrors, 'truncated': stopped is not None,
+		'stopped': stopped, 'info': infoLog, 'findings': found.findings}
+
+#
+# Read and check just the header, stopping at its EOH.  A header with no
+# EOH is only read as far as the longest record allowed.
+#
+def parseHeader(buf):
+	if not inHeader:
+		return headerFields
+	try:
+		parseFast(buf, 0, min(len(buf), opts.max_record + 1))
+	except StopValidation:
+		pass
+	return headerFields
+
+#
+# The header tags of a log and the findings on them, checked against the
+# ADIF header tags without reading past the header.  No report is written
+# unless the options ask for one.
+#
+def readHeader(logPath, args=None):
+	global inHeader
+
+	startRun(['-q', '--header-only'] + (args or []))
+	found = adifreport.ListSink()
+	sinks.append(found)
+	with open(logPath, 'rb') as adif:
+		if os.fstat(adif.fileno()).st_size > 0:
+			buf = mmap.mmap(adif.fileno(), 0, access=mmap.ACCESS_READ)
+			indexBuffer(buf)
+			if buf[:1] == b'<':
+				inHeader = False
+			parseHeader(buf)
+			endRun()
+			buf.close()
+		else:
+			endRun()
+	return {'header': headerFields, 'errors': compErrors + consErrors, 'findings': found.findings}
+
+#
+# Checkpoints.  The state at the end of the last record - where it ends,
+# its line, the header and user tags, and the counts - is noted after each
+# EOR and written out now and then, and when validation stops.  A run
+# resumed from it starts at that offset; only the line count is taken on
+# trust, so the log before it is never read.  Findings in a record that
+# was cut short are reported again by the resumed run.
+#
+def cancel():
+	global cancelled
+	cancelled = True
+
+def cancelOnSignal(signum, frame):
+	cancel()
+
+def noteCheckpoint(offset):
+	global checkpointState
+	checkpointState = (offset, inHeader, qsos, compErrors, consErrors, nonASCII)
+
+def markCheckpoint():
+	noteCheckpoint(adifPos)
+	if time.monotonic() - checkpointSaved > CHECKPOINT_INTERVAL:
+		saveCheckpoint(opts.checkpoint)
+
+def makeCheckpoint():
+	(offset, header, count, comp, cons, nonASCIILine) = checkpointState
+	return {'version': CHECKPOINT_VERSION, 'log': os.path.abspath(logFile), 'size': len(lineBuf),
+		'options': dict((name, getattr(opts, name)) for name in checkpointOptions),
+		'offset': offset, 'line': lineAt(offset), 'inHeader': header,
+		'header': headerFields, 'userTags': userTags,
+		'qsos': count, 'compErrors': comp, 'consErrors': cons, 'nonASCII': nonASCIILine,
+		'complete': offset >= len(lineBuf)}
+
+def saveCheckpoint(path):
+	global checkpointSaved
+	tmp = path + '.tmp'
+	with open(tmp, 'w') as out:
+		json.dump(makeCheckpoint(), out, indent=1)
+	os.replace(tmp, path)
+	checkpointSaved = time.monotonic()
+
+def loadCheckpoint(path):
+	try:
+		with open(path) as inp:
+			checkpoint = json.load(inp)
+	except (OSError, ValueError) as e:
+		raise CheckpointError("can't read the checkpoint %s: %s" % (path, e))
+	if checkpoint.get('version') != CHECKPOINT_VERSION:
+		raise CheckpointError("%s is not a version %d checkpoint" % (path, CHECKPOINT_VERSION))
+	for name in checkpointOptions:
+		if checkpoint['options'][name] != getattr(opts, name):
+			raise CheckpointError("%s was saved with --%s %s, not %s - resume with the options of the run before" % (path, name.replace('_', '-'), optionText(checkpoint['options'][name]), optionText(getattr(opts, name))))
+	return checkpoint
+
+def optionText(value):
+	if isinstance(value, list):
+		return "'%s'" % (','.join(value))
+	return "'%s'" % (value)
 
-	with open(opts.input_file, 'rb') as adif:
-		inChar = getByte(adif, ADIF_STATE_BEGIN, '')
-		if not inChar:
-			print("[ERROR] empty file?")
-			sys.exit(1)
+#
+# Take up the state saved in a checkpoint, returning the offset to carry
+# on from.
+#
+def restoreCheckpoint(checkpoint, buf):
+	global inHeader
+	global qsos
+	global compErrors
+	global consErrors
+	global nonASCII
+	offset = checkpoint['offset']
+	indexBuffer(buf, offset, checkpoint['line'])
+	inHeader = checkpoint['inHeader']
+	headerFields.update(checkpoint['header'])
+	userTags.update(checkpoint['userTags'])
+	qsos = checkpoint['qsos']
+	compErrors = checkpoint['compErrors']
+	consErrors = checkpoint['consErrors']
+	nonASCII = checkpoint['nonASCII']
+	return offset
 
+#
+# Parse a whole log with the options of the current run, and finish the
+# run.  Returns the size of the log, the lines read and why validation
+# stopped early, or None.
+#
+def parseLog(logPath):
+	global inHeader
+	global recordIndex
+	global logFile
+	global adifPos
+	global checkpointSaved
+
+	logFile = logPath
+	checkpoint = resumed
+	if checkpoint is not None and checkpoint['log'] != os.path.abspath(logPath):
+		raise CheckpointError("%s was saved for %s, not %s" % (opts.resume, checkpoint['log'], os.path.abspath(logPath)))
+	if profiling:
+		profileEnter('read')
+	if opts.memstats:
+		startMemstats()
+	with open(logPath, 'rb') as adif:
+		size = os.fstat(adif.fileno()).st_size
+		if checkpoint is not None and checkpoint['size'] != size:
+			raise CheckpointError("the checkpoint does not match %s - it was saved for a %d byte file, not %d" % (logPath, checkpoint['size'], size))
+		if size == 0:
+			endRun()
+			return (0, 0, None)
+		buf = mmap.mmap(adif.fileno(), 0, access=mmap.ACCESS_READ)
+		indexBuffer(buf)
+		if opts.index_file:
+			recordIndex = adifindex.AdifIndex()
+			recordIndex.logSize = size
+
+		start = 0
+		if checkpoint is not None:
+			start = restoreCheckpoint(checkpoint, buf)
 		# if there's a '<' in the first byte, there is no header
-		if inChar == '<':
-			adif.seek(-1, os.SEEK_CUR) # push that back
+		elif buf[:1] == b'<':
 			Info("This ADIF file has no header")
 			inHeader = False
-
-		# Reset everything
-		adifTag = ''
-		adifValue = ''
-		adifLen = 0
-		adifSize = '' 
-		adifType = ''
-		adifState = ADIF_STATE_BEGIN
-		adifLine = 1
-		badLen = 0
-
-		while adifState != ADIF_STATE_DONE:
-			if adifState == ADIF_STATE_CHECK:
-				# Ignore app-specific tags
-				if adifTag[:4] == 'APP_':
-					# reset for next round
-					adifTag = ''
-					adifValue = ''
-					adifLen = 0
-					adifSize = '' 
-					adifType = ''
-					adifState = ADIF_STATE_BEGIN
-					continue
-
-				# Handle userdefs
-
-				if adifTag[:7] == 'USERDEF':
-                                    userNum = adifTag[7:]
-                                    if userNum.isnumeric():
-                                        adifTag = "USERDEF"
-                                        userTags[adifValue] = adifType
-
-				if adifTag != 'EOH':
-					verifyTag(adifTag, adifValue, adifSize, adifType)
-
-				if not adifTag in qso:
-					setTagInQSO(qso, adifTag, adifValue, adifLine, inHeader)
-
-				tagLines[adifTag] = adifLine
-				if inHeader:
-					if adifTag == 'EOH':
-						inHeader = False
-						qso = {}
-						tagLines = {}
-					if not adifTag in headerTags:
-						complianceError("tag '%s' is not a valid tag in the header" % (adifTag), adifLine)
-					if adifTag == 'EOR':
-						complianceError("Got <EOR> tag while processing header", adifLine)
+		adifPos = start
+		if checkpointing:
+			noteCheckpoint(start)
+			checkpointSaved = time.monotonic()
+
+		stopped = None
+		if opts.progress:
+			startProgress(size)
+		if profiling:
+			profileLeave('tokenize')
+		try:
+			if opts.header_only:
+				parseHeader(buf)
+				adifLines = lineAt(adifPos)
+			else:
+				if opts.engine == 'legacy':
+					parseLegacy(buf, start)
 				else:
-					if not adifTag in qsoTags and not adifTag in userTags:
-						complianceError ("tag '%s' (%s) is not a valid tag in a QSO record" % (adifTag, adifValue), adifLine)
-
-					if adifTag == 'EOH':
-						complianceError ("Got  EOH tag while not in the header", adifLine)
-				if adifTag == 'EOR':
-					# handle QSO here
-					verifyQSO()
-					qso = {}
-					qsos = qsos + 1
-				# reset for next round
-				adifTag = ''
-				adifValue = ''
-				adifLen = 0
-				adifSize = '' 
-				adifType = ''
-				adifState = ADIF_STATE_BEGIN
-				continue
+					parseFast(buf, start)
+				adifLines = lineAt(len(buf))
+		except StopValidation as stop:
+			stopped = str(stop)
+			adifLines = lineAt(adifPos)
+		except Exception:
+			abandonRun()
+			buf.close()
+			raise
+		if opts.progress:
+			showProgress(True)
+		if opts.memstats:
+			takeMemstats()
+		# Sinks may still need line numbers
+		endRun()
+		if checkpointing:
+			if not stopped:
+				noteCheckpoint(size)
+			saveCheckpoint(opts.checkpoint)
+		if opts.stats:
+			with open(opts.stats, 'w') as out:
+				json.dump(runStats(size), out, indent=1)
+		buf.close()
+	return (size, adifLines, stopped)
 
-			inChar = getByte(adif, adifState, adifTag)
-			if not inChar:			# EOF
-				break
-
-			if adifState != ADIF_STATE_GET_DATA and adifState != ADIF_STATE_GET_NEWLINE:
-				if inChar == '\n':
-					global nonASCII
-					nonASCII = -1
-					adifLine = adifLine + 1
-					continue
-				if inChar == '\r':		# ignore CR
-					continue
-			# Begin state - just keep reading until you get a '<'.
-			if adifState == ADIF_STATE_BEGIN:
-				if '<' == inChar:		# start of a tag
-					adifState = ADIF_STATE_GET_NAME
-				continue
-
-			# Get the tag name - add chars until '>' or ':' found
-			elif adifState == ADIF_STATE_GET_NAME:
-				if ':' == inChar or '>' == inChar:		# end of tag
-					adifState = ADIF_STATE_GET_SIZE
-					if inChar == '>':			# end of tag, no size
-						adifState = ADIF_STATE_CHECK
-						continue
-				else:
-					adifTag = adifTag + inChar.upper()
-					adifLen = 0
-				continue
+#
+# Validate a log and return what was found, without writing a report
+# unless the options ask for one.  Informational messages are returned in
+# 'info' rather than printed.  With a time budget in seconds the records
+# are checked until it runs out; 'truncated' is then set, and 'offset' and
+# 'lines' say how far the log was read.
+#
+def validateLog(logPath, args=None, timeBudget=None):
+	global infoLog
+
+	args = ['-q'] + (args or [])
+	if timeBudget is not None:
+		args = args + ['--time-budget', str(timeBudget)]
+	startRun(args)
+	infoLog = []
+	found = adifreport.ListSink()
+	sinks.append(found)
+	(size, adifLines, stopped) = parseLog(logPath)
+	offset = size
+	if stopped:
+		offset = adifPos
+	return {'bytes': size, 'lines': adifLines, 'offset': offset, 'qsos': qsos, 'errors': compErrors + consErrors,
+		'truncated': stopped is not None, 'stopped': stopped, 'info': infoLog, 'findings': found.findings}
 
-			elif adifState == ADIF_STATE_GET_SIZE:
-				if ':' == inChar or '>' == inChar:		# end of size
-					if ':' == inChar:
-						adifState = ADIF_STATE_GET_TYPE
-					else:
-						adifState = ADIF_STATE_GET_DATA
-				else:
-					adifSize = adifSize + inChar
-					if adifSize.isnumeric():
-						adifLen = int(adifSize)
-						badLen = 0
-					else:
-						complianceError("Length field '%s' is not numeric" % (adifSize), adifLine)
-						badLen = badLen + 1
-						if badLen > 500:
-							sys.exit(1)
-				continue
+def main():
+	global recordIndex
 
-			elif adifState == ADIF_STATE_GET_TYPE:
-				if '>' == inChar:						# no explicit type
-					adifState = ADIF_STATE_GET_DATA
-					if adifType != '' and adifType not in dataTypes:
-						complianceError("Data Type '%s' is not valid" % (adifType), adifLine)
-				else:
-					adifType = adifType + inChar.upper()
-				continue
+	try:
+		startRun()
+	except CheckpointError as e:
+		print("[ERROR] %s" % (e))
+		sys.exit(1)
 
-			elif adifState == ADIF_STATE_GET_DATA:
-				if adifLen == 0:
-					setTagInQSO(qso, adifTag, adifValue, adifLine, inHeader)
-					tagLines[adifTag] = adifLine
-					adifState = ADIF_STATE_CHECK
-				else:
-					adifValue = adifValue + inChar
-					adifLen = adifLen - 1
-					if inChar == '\n':
-						nonASCII = -1
-						adifLine = adifLine + 1
-						complianceError("Newline in data string for %s did not have preceding Return" % (adifTag), adifLine);
-					if inChar == '\r':
-						adifState = ADIF_STATE_GET_NEWLINE
-					if adifLen == 0:
-						setTagInQSO(qso, adifTag, adifValue, adifLine, inHeader)
-						tagLines[adifTag] = adifLine
-						adifState = ADIF_STATE_CHECK
-				continue
+	if not opts.input_file:
+		print ("[ERROR] you must specify an input file with -f")
+		sys.exit(1)
 
-			elif adifState == ADIF_STATE_GET_NEWLINE:
-				adifValue = adifValue + inChar
-				adifLen = adifLen - 1
-				if inChar != '\n':
-					complianceError("Return in data string for %s did not have following Newline" % (adifTag), adifLine);
-				nonASCII = -1
-				adifLine = adifLine + 1
-				if adifLen == 0:
-					setTagInQSO(qso, adifTag, adifValue, adifLine, inHeader)
-					tagLines[adifTag] = adifLine
-					adifState = ADIF_STATE_CHECK
-				else:
-					adifState = ADIF_STATE_GET_DATA
-				continue
+	if os.path.getsize(opts.input_file) == 0:
+		print("[ERROR] empty file?")
+		sys.exit(1)
+	# A batch worker being preempted gets to save its checkpoint
+	if opts.checkpoint:
+		signal.signal(signal.SIGTERM, cancelOnSignal)
+	try:
+		(size, adifLines, stopped) = parseLog(opts.input_file)
+	except CheckpointError as e:
+		print("[ERROR] %s" % (e))
+		sys.exit(1)
 
-	adif.close()
-	if opts.cons_file:
-		consFile.close()
-	if opts.comp_file:
-		compFile.close()
-	Info ("Handled %d lines, %d QSOs, Errors: %d " % (adifLine, qsos, compErrors + consErrors))
+	if stopped:
+		Info(stopped)
+	if opts.header_only:
+		for tag in headerFields:
+			Info("Header %s: %s" % (tag, headerFields[tag]))
+		recordIndex = None
+	if recordIndex is not None:
+		if stopped:
+			Info("The record index was not written as the file was not read to the end")
+		else:
+			recordIndex.userTags = userTags
+			recordIndex.save(opts.index_file)
+
+	Info ("Handled %d lines, %d QSOs, Errors: %d " % (adifLines, qsos, compErrors + consErrors))
+	if opts.profile:
+		profileSummary(size)
+	if opts.memstats:
+		memSummary()
+	if opts.fail_fast and compErrors > 0:
+		sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,441 @@
+#!/bin/python
+# K1MU ADIF Parser - report sinks
+# Copyright (c) 2020,2022
+#
+# The parser hands every finding to each sink as it is made, and tells the
+# sinks when a QSO record is about to be verified, with its QSO key and
+# the record's tags, or that a record was cut short before its EOR.  A
+# finding is only turned
+# into text by the sinks that write it, so a run with no sinks just counts.
+#
+# A finding has:
+#	rule		stable rule code, e.g. 'BAD_STATE'
+#	severity	'compliance' or 'consistency'
+#	qso		the QSO key gathered by makeQSOinfo() - CALL, QSO_DATE,
+#			TIME_ON, BAND (or FREQ if there is no BAND) and MODE -
+#			or None for the header
+#	line()		the line it was found on
+#	message()	the rendered message
+#	tagName()	the tag it concerns, or None
+#	valueText()	the offending value, or None
+
+import html
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+compBanner = {
+	False: "The following messages represent issues where the submitted ADIF file is not compliant\nwith the ADIF standard.\n\n",
+	True: "<h3>The following messages represent issues where the submitted ADIF file is not compliant with the ADIF standard.</h3>\n"
+}
+consBanner = {
+	False: "The following messages represent issues where the QSOs in the submitted ADIF file are compliant\nwith the ADIF standard, but have inconsistent details such as invalid Country, Zones, etc.\nThese findings do not indicate any structural issues with the submitted ADIF file,\nbut they do indicate potentially incorrect records for the QSO being analyzed.\n",
+	True: "<h3>The following messages represent issues where the QSOs in the submitted ADIF file are compliant with the ADIF standard, but have inconsistent details such as invalid Country, Zones, etc. These findings do not indicate any structural issues with the submitted ADIF file, but they do indicate potentially incorrect records for the QSO being analyzed.</h3>\n"
+}
+
+# Under the banner of a run resumed from a checkpoint
+continuedNote = {
+	False: "Continued from line %d, where the run before stopped - its report has the findings before that line.\n",
+	True: "<p>Continued from line %d, where the run before stopped - its report has the findings before that line.</p>\n"
+}
+
+formats = ('text', 'html', 'ndjson')
+# -o can also write a paginated HTML report into a directory, or a database
+outputFormats = formats + ('pages', 'sqlite')
+
+# How many line numbers an aggregated finding lists
+AGGREGATE_LINES = 5
+
+class TextSink:
+	def __init__(self, compFile, consFile, html=False, continued=0):
+		self.compFile = compFile
+		self.consFile = consFile
+		self.html = html
+		self.continued = continued
+		self.compLines = []
+		self.compBanner = False
+		self.consBanner = False
+		self.consHeader = False
+		self.key = None
+
+	def qsoHeader(self, key):
+		if self.html:
+			start = '\n<br /><b>'
+		else:
+			start = '\n'
+		info = ''
+		if key['call'] != '':
+			info = start + 'For the QSO with ' + key['call']
+
+		qso_date = key['qso_date']
+		if qso_date != '':
+			if len(qso_date) == 8:
+				qso_date = qso_date[:4] + '-' + qso_date[4:6] + '-' + qso_date[6:8]
+			if info != '':
+				info = info + ' on '
+			else:
+				info = start + 'For the qso on '
+			info = info + qso_date
+
+		band = key['band'] or key.get('freq', '')
+		if band != '':
+			if info != '':
+				info = info + ' '
+			info = info + band
+
+		if key['mode'] != '':
+			if info != '':
+				info = info + ' '
+			info = info + key['mode']
+		info = info + ':'
+		if self.html:
+			info = info + "</b><br />"
+		return info + "\n"
+
+	def line(self, text):
+		if self.html:
+			return text + "<br />\n"
+		return text + "\n"
+
+	def finding(self, f):
+		if f.severity == 'compliance':
+			if not self.compBanner:
+				self.banner(self.compFile, compBanner)
+				self.compBanner = True
+			self.compLines.append(self.line("ADIF Compliance error on line %d: %s" % (f.line(), f.message())))
+			return
+
+		if not self.consBanner:
+			self.banner(self.consFile, consBanner)
+			self.consBanner = True
+		if not self.consHeader and self.key is not None:
+			self.consFile.write(self.qsoHeader(self.key))
+			self.consHeader = True
+		self.consFile.write(self.line("Consistency error on line %d: %s" % (f.line(), f.message())))
+
+	def banner(self, out, banner):
+		out.write(banner[self.html])
+		if self.continued:
+			out.write(continuedNote[self.html] % (self.continued))
+
+	#
+	# Compliance findings are held back until the record they were found in
+	# is verified, so they can go out under its QSO heading.
+	#
+	def record(self, key, fields):
+		self.key = key
+		self.consHeader = False
+		self.spew()
+
+	def spew(self):
+		if not self.compLines:
+			return
+		if self.key is not None:
+			self.compFile.write(self.qsoHeader(self.key))
+		self.compFile.write(''.join(self.compLines))
+		self.compLines = []
+
+	#
+	# The findings held back belong to a record that was thrown away or
+	# never finished, so it has no QSO key to head them.
+	#
+	def incomplete(self, line):
+		if not self.compLines:
+			return
+		if self.html:
+			self.compFile.write("\n<br /><b>For the incomplete record at line %d:</b><br />\n" % (line))
+		else:
+			self.compFile.write("\nFor the incomplete record at line %d:\n" % (line))
+		self.compFile.write(''.join(self.compLines))
+		self.compLines = []
+
+	def close(self):
+		self.key = None
+		self.spew()
+
+class NdjsonSink:
+	def __init__(self, compFile, consFile):
+		self.compFile = compFile
+		self.consFile = consFile
+
+	def finding(self, f):
+		if f.severity == 'compliance':
+			out = self.compFile
+		else:
+			out = self.consFile
+		out.write(json.dumps(findingDict(f), separators=(',', ':')) + "\n")
+
+	def record(self, key, fields):
+		return
+
+	def incomplete(self, line):
+		return
+
+	def close(self):
+		return
+
+#
+# Keeps the findings as dictionaries, for callers of the library API.
+#
+class ListSink:
+	def __init__(self):
+		self.findings = []
+
+	def finding(self, f):
+		self.findings.append(findingDict(f))
+
+	def record(self, key, fields):
+		return
+
+	def incomplete(self, line):
+		return
+
+	def close(self):
+		return
+
+#
+# Collapse findings with the same rule and message into one line with a
+# count and the first few lines they were found on.  The message takes in
+# the record's context - DXCC, dates and times - so findings are only
+# grouped when every line they list would read the same.  Nothing is
+# written until the end of the run.
+#
+class AggregateSink:
+	def __init__(self, compFile, consFile, format='text', continued=0):
+		self.compFile = compFile
+		self.consFile = consFile
+		self.format = format
+		self.continued = continued
+		self.groups = {}
+
+	def finding(self, f):
+		key = (f.rule, f.message())
+		group = self.groups.get(key)
+		if group is None:
+			self.groups[key] = [f, 1, [f.line()]]
+			return
+		group[1] = group[1] + 1
+		if len(group[2]) < AGGREGATE_LINES:
+			group[2].append(f.line())
+
+	def record(self, key, fields):
+		return
+
+	def incomplete(self, line):
+		return
+
+	def close(self):
+		self.write('compliance', self.compFile, "ADIF Compliance error", compBanner)
+		self.write('consistency', self.consFile, "Consistency error", consBanner)
+		self.groups = {}
+
+	def write(self, severity, out, kind, banner):
+		html = self.format == 'html'
+		first = True
+		for (f, count, lines) in self.groups.values():
+			if f.severity != severity:
+				continue
+			if self.format == 'ndjson':
+				out.write(json.dumps({'rule': f.rule, 'severity': f.severity, 'tag': f.tagName(),
+					'value': f.valueText(), 'count': count, 'lines': lines,
+					'message': f.message()}, separators=(',', ':')) + "\n")
+				continue
+			if first:
+				out.write(banner[html])
+				if self.continued:
+					out.write(continuedNote[html] % (self.continued))
+				first = False
+			if count == 1:
+				text = "%s on line %d: %s" % (kind, lines[0], f.message())
+			else:
+				more = ''
+				if count > len(lines):
+					more = ', ...'
+				text = "%s %d times, on lines %s%s: %s" % (kind, count, ', '.join(str(l) for l in lines), more, f.message())
+			if html:
+				text = text + "<br />"
+			out.write(text + "\n")
+
+def findingDict(f):
+	return {'rule': f.rule, 'severity': f.severity, 'line': f.line(),
+		'tag': f.tagName(), 'value': f.valueText(),
+		'message': f.message(), 'qso': f.qso}
+
+#
+# 'continued' is the line a resumed run started from, noted under the
+# banners; ndjson has no banners and each finding gives its own line.
+#
+def makeSink(format, compFile, consFile, aggregate=False, continued=0):
+	if aggregate:
+		return AggregateSink(compFile, consFile, format, continued)
+	if format == 'ndjson':
+		return NdjsonSink(compFile, consFile)
+	return TextSink(compFile, consFile, format == 'html', continued)
+
+#
+# HTML report split over pages of a fixed number of findings, written into
+# a directory as the findings come in, with an index.html giving the count
+# for each rule and a link to each QSO with findings.
+#
+class HtmlPagesSink:
+	def __init__(self, directory, pageSize=1000):
+		self.directory = directory
+		self.pageSize = pageSize
+		self.page = None
+		self.pages = 0
+		self.onPage = 0
+		self.key = False
+		self.held = []
+		self.qsos = []
+		self.rules = {}
+		os.makedirs(directory, exist_ok=True)
+
+	def pageName(self, n):
+		return 'page%04d.html' % (n)
+
+	def newPage(self):
+		self.endPage()
+		self.pages = self.pages + 1
+		self.page = open(os.path.join(self.directory, self.pageName(self.pages)), 'w')
+		self.page.write("<html><head><title>ADIF report page %d</title></head><body>\n" % (self.pages))
+		self.page.write('<p><a href="index.html">Index</a>')
+		if self.pages > 1:
+			self.page.write(' <a href="%s">Previous</a>' % (self.pageName(self.pages - 1)))
+		self.page.write("</p>\n")
+		self.onPage = 0
+
+	def endPage(self, last=False):
+		if self.page is None:
+			return
+		if not last:
+			self.page.write('<p><a href="%s">Next</a></p>\n' % (self.pageName(self.pages + 1)))
+		self.page.write("</body></html>\n")
+		self.page.close()
+		self.page = None
+
+	#
+	# Findings with no QSO key are held back until it is known whether they
+	# are the header's or those of a record cut short before its EOR.
+	#
+	def finding(self, f):
+		if f.qso is None:
+			self.held.append(f)
+			return
+		self.release(None, qsoTitle(None))
+		self.write(f, f.qso, qsoTitle(f.qso))
+
+	def release(self, key, title):
+		for f in self.held:
+			self.write(f, key, title)
+		self.held = []
+
+	def write(self, f, key, title):
+		if self.page is None or self.onPage >= self.pageSize:
+			self.newPage()
+		if key is not self.key:
+			self.key = key
+			self.qsos.append([self.pages, title, 0])
+			self.page.write('<h4 id="qso%d">%s</h4>\n' % (len(self.qsos), html.escape(self.qsos[-1][1], False)))
+		elif self.onPage == 0:
+			self.page.write('<h4>%s (continued)</h4>\n' % (html.escape(self.qsos[-1][1], False)))
+		self.qsos[-1][2] = self.qsos[-1][2] + 1
+		if f.severity == 'compliance':
+			kind = "ADIF Compliance error"
+		else:
+			kind = "Consistency error"
+		self.page.write("%s on line %d: %s<br />\n" % (kind, f.line(), html.escape(f.message(), False)))
+		if not f.rule in self.rules:
+			self.rules[f.rule] = [f.severity, 0, self.pages, len(self.qsos)]
+		self.rules[f.rule][1] = self.rules[f.rule][1] + 1
+		self.onPage = self.onPage + 1
+
+	def record(self, key, fields):
+		self.release(None, qsoTitle(None))
+
+	def incomplete(self, line):
+		self.release(('incomplete', line), 'Incomplete record at line %d' % (line))
+
+	def close(self):
+		self.release(None, qsoTitle(None))
+		self.endPage(True)
+		with open(os.path.join(self.directory, 'index.html'), 'w') as index:
+			index.write("<html><head><title>ADIF report</title></head><body>\n")
+			index.write("<h3>%d findings on %d pages</h3>\n" % (sum(r[1] for r in self.rules.values()), self.pages))
+			index.write("<table>\n<tr><th>Rule</th><th>Severity</th><th>Count</th></tr>\n")
+			for rule in sorted(self.rules, key=lambda r: -self.rules[r][1]):
+				(severity, count, page, qso) = self.rules[rule]
+				index.write('<tr><td><a href="%s#qso%d">%s</a></td><td>%s</td><td>%d</td></tr>\n' % (self.pageName(page), qso, rule, severity, count))
+			index.write("</table>\n<h3>QSOs</h3>\n")
+			for (n, (page, title, count)) in enumerate(self.qsos):
+				index.write('<a href="%s#qso%d">%s</a> (%d)<br />\n' % (self.pageName(page), n + 1, html.escape(title, False), count))
+			index.write("</body></html>\n")
+
+#
+# Every QSO key and finding put into an SQLite database, which may hold the
+# results for any number of logs.  Rows are inserted with executemany(), a
+# batch to a transaction.
+#
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (id INTEGER PRIMARY KEY, path TEXT, started TEXT);
+CREATE TABLE IF NOT EXISTS qsos (log INTEGER, qso INTEGER, call TEXT, qso_date TEXT, time_on TEXT, band TEXT, mode TEXT, dxcc TEXT, PRIMARY KEY (log, qso));
+CREATE TABLE IF NOT EXISTS findings (log INTEGER, qso INTEGER, rule TEXT, severity TEXT, line INTEGER, tag TEXT, value TEXT, message TEXT);
+CREATE INDEX IF NOT EXISTS qsos_call ON qsos (call);
+CREATE INDEX IF NOT EXISTS qsos_dxcc ON qsos (dxcc);
+CREATE INDEX IF NOT EXISTS qsos_date ON qsos (qso_date);
+CREATE INDEX IF NOT EXISTS findings_rule ON findings (rule);
+CREATE INDEX IF NOT EXISTS findings_qso ON findings (log, qso);
+"""
+
+SQLITE_BATCH = 10000
+
+class SqliteSink:
+	def __init__(self, path, logPath=''):
+		self.db = sqlite3.connect(path)
+		self.db.executescript(SQLITE_SCHEMA)
+		with self.db:
+			self.log = self.db.execute("INSERT INTO logs (path, started) VALUES (?, ?)", (logPath, datetime.now().isoformat(' ', 'seconds'))).lastrowid
+		self.qsos = []
+		self.findings = []
+		self.count = 0
+		self.key = None
+
+	def finding(self, f):
+		if f.qso is None:
+			qso = None
+		elif f.qso is self.key:
+			qso = self.count
+		else:
+			# Found while reading a record that is yet to be verified
+			qso = self.count + 1
+		self.findings.append((self.log, qso, f.rule, f.severity, f.line(), f.tagName(), f.valueText(), f.message()))
+		if len(self.findings) >= SQLITE_BATCH:
+			self.flush()
+
+	def record(self, key, fields):
+		self.count = self.count + 1
+		self.key = key
+		self.qsos.append((self.log, self.count, key['call'], key['qso_date'], key['time_on'],
+			key['band'] or key.get('freq', ''), key['mode'], fields.get('DXCC', '').strip()))
+		if len(self.qsos) >= SQLITE_BATCH:
+			self.flush()
+
+	def incomplete(self, line):
+		return
+
+	def flush(self):
+		with self.db:
+			self.db.executemany("INSERT INTO qsos VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.qsos)
+			self.db.executemany("INSERT INTO findings VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.findings)
+		self.qsos = []
+		self.findings = []
+
+	def close(self):
+		self.flush()
+		self.db.close()
+
+def qsoTitle(key):
+	if key is None:
+		return 'Header'
+	title = ' '.join(v for v in (key['call'], key['qso_date'], key['time_on'], key['band'] or key.get('freq', ''), key['mode']) if v != '')
+	return title or 'QSO'
@@ -0,0 +1,283 @@
+#!/bin/python
+# K1MU ADIF Parser - validation service
+# Copyright (c) 2020,2022
+#
+# A long running local service around adifparse.validateLog().  A log
+# POSTed to /validate is checked and the findings come back as JSON; GET
+# /metrics gives the service's counters in the Prometheus text format.
+# The parser keeps its state in module globals, so logs are validated one
+# at a time and the rest wait in a queue of limited depth.  Results are
+# kept, as the JSON sent back, in a cache keyed by the log's SHA-256 and
+# the options and limited in entries and bytes, as the same log is often
+# uploaded more than once.  The parser's informational messages come back
+# in the result rather than on the service's stdout.  A log the parser
+# fails on with an exception gets a 500 reply and is counted as a failed
+# validation.
+
+from optparse import OptionParser
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import traceback
+
+import adifparse
+
+# Upper bounds of the validation time histogram, in seconds
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Options a client may give as query parameters, and whether they take a value
+queryOptions = {
+	'only' : True,
+	'skip' : True,
+	'structure-only' : False,
+	'max-errors' : True,
+	'engine' : True,
+	'max-field' : True,
+	'max-record' : True,
+	'max-length-errors' : True,
+	'time-budget' : True,
+}
+
+def option_parsing(args=None):
+	parser = OptionParser(usage='%prog [options]')
+
+	parser.add_option('--host', dest='host', default='127.0.0.1', help='Address to listen on (default 127.0.0.1)')
+	parser.add_option('--port', dest='port', type='int', default=8073, help='Port to listen on (default 8073)')
+	parser.add_option('--max-queue', dest='max_queue', type='int', default=16, help='Logs that may wait for the validator before uploads are turned away (default 16)')
+	parser.add_option('--max-upload', dest='max_upload', type='int', default=268435456, help='Largest log accepted, in bytes (default 268435456)')
+	parser.add_option('--cache', dest='cache', type='int', default=64, help='Results kept for logs uploaded again, 0 for none (default 64)')
+	parser.add_option('--cache-bytes', dest='cache_bytes', type='int', default=67108864, help='Most bytes of results kept for logs uploaded again (default 67108864)')
+
+	(options, args) = parser.parse_args(args)
+
+	return (options, args)
+
+def escapeLabel(value):
+	return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def labels(**pairs):
+	return '{' + ','.join('%s="%s"' % (name, escapeLabel(str(pairs[name]))) for name in pairs) + '}'
+
+class Metrics:
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.requests = {}
+		self.inFlight = 0
+		self.queued = 0
+		self.latency = [0] * len(LATENCY_BUCKETS)
+		self.latencySum = 0.0
+		self.latencyCount = 0
+		self.bytes = 0
+		self.qsos = 0
+		self.failures = 0
+		self.findings = {}
+		self.cacheHits = 0
+		self.cacheMisses = 0
+
+	def request(self, path, code):
+		with self.lock:
+			key = (path, code)
+			self.requests[key] = self.requests.get(key, 0) + 1
+
+	def validated(self, seconds, result):
+		with self.lock:
+			for bucket in range(len(LATENCY_BUCKETS)):
+				if seconds <= LATENCY_BUCKETS[bucket]:
+					self.latency[bucket] = self.latency[bucket] + 1
+					break
+			self.latencySum = self.latencySum + seconds
+			self.latencyCount = self.latencyCount + 1
+			self.bytes = self.bytes + result['bytes']
+			self.qsos = self.qsos + result['qsos']
+			for f in result['findings']:
+				key = (f['rule'], f['severity'])
+				self.findings[key] = self.findings.get(key, 0) + 1
+
+	def render(self):
+		out = []
+		def metric(name, type, help, samples):
+			out.append('# HELP %s %s' % (name, help))
+			out.append('# TYPE %s %s' % (name, type))
+			for (suffix, value) in samples:
+				out.append('%s%s %s' % (name, suffix, value))
+
+		with self.lock:
+			metric('adif_requests_total', 'counter', 'HTTP requests handled, by path and status code.',
+				[(labels(path=path, code=code), n) for ((path, code), n) in sorted(self.requests.items())])
+			metric('adif_jobs_in_flight', 'gauge', 'Logs being validated now.', [('', self.inFlight)])
+			metric('adif_jobs_queued', 'gauge', 'Logs waiting for the validator.', [('', self.queued)])
+			samples = []
+			total = 0
+			for bucket in range(len(LATENCY_BUCKETS)):
+				total = total + self.latency[bucket]
+				samples.append(('_bucket' + labels(le=LATENCY_BUCKETS[bucket]), total))
+			samples.append(('_bucket' + labels(le='+Inf'), self.latencyCount))
+			samples.append(('_sum', '%.6f' % (self.latencySum)))
+			samples.append(('_count', self.latencyCount))
+			metric('adif_validation_seconds', 'histogram', 'Time to validate a log, not counting cached results.', samples)
+			metric('adif_bytes_total', 'counter', 'Bytes of ADIF validated.', [('', self.bytes)])
+			metric('adif_qsos_total', 'counter', 'QSOs validated.', [('', self.qsos)])
+			metric('adif_validation_failures_total', 'counter', 'Logs the validator failed on with an internal error.', [('', self.failures)])
+			metric('adif_findings_total', 'counter', 'Findings reported, by rule and severity.',
+				[(labels(rule=rule, severity=severity), n) for ((rule, severity), n) in sorted(self.findings.items())])
+			metric('adif_cache_hits_total', 'counter', 'Uploads answered from the result cache.', [('', self.cacheHits)])
+			metric('adif_cache_misses_total', 'counter', 'Uploads that had to be validated.', [('', self.cacheMisses)])
+			lookups = self.cacheHits + self.cacheMisses
+			metric('adif_cache_hit_ratio', 'gauge', 'Share of uploads answered from the result cache.',
+				[('', '%.6f' % (self.cacheHits / lookups if lookups else 0.0))])
+			metric('adif_tag_names_cached', 'gauge', 'Tag names held in the parser\'s decoded name cache.', [('', len(adifparse.tagNames))])
+		return '\n'.join(out) + '\n'
+
+class ValidationService:
+	def __init__(self, opts):
+		self.opts = opts
+		self.metrics = Metrics()
+		self.validator = threading.Lock()
+		self.cacheLock = threading.Lock()
+		self.cache = OrderedDict()
+		self.cacheBytes = 0
+
+	def cached(self, key):
+		with self.cacheLock:
+			reply = self.cache.get(key)
+			if reply is not None:
+				self.cache.move_to_end(key)
+			return reply
+
+	def remember(self, key, reply):
+		if self.opts.cache <= 0 or len(reply) > self.opts.cache_bytes:
+			return
+		with self.cacheLock:
+			if key in self.cache:
+				return
+			self.cache[key] = reply
+			self.cacheBytes = self.cacheBytes + len(reply)
+			while len(self.cache) > self.opts.cache or self.cacheBytes > self.opts.cache_bytes:
+				(old, oldReply) = self.cache.popitem(last=False)
+				self.cacheBytes = self.cacheBytes - len(oldReply)
+
+	#
+	# Validate an uploaded log, returning the HTTP status and the JSON
+	# reply.
+	#
+	def validate(self, body, args):
+		metrics = self.metrics
+		key = (hashlib.sha256(body).hexdigest(), tuple(args))
+		reply = self.cached(key)
+		if reply is not None:
+			with metrics.lock:
+				metrics.cacheHits = metrics.cacheHits + 1
+			return (200, reply)
+		with metrics.lock:
+			metrics.cacheMisses = metrics.cacheMisses + 1
+			if metrics.queued >= self.opts.max_queue:
+				return (503, jsonReply({'error': 'too many logs waiting, try again later'}))
+			metrics.queued = metrics.queued + 1
+		with self.validator:
+			with metrics.lock:
+				metrics.queued = metrics.queued - 1
+				metrics.inFlight = metrics.inFlight + 1
+			(fd, path) = tempfile.mkstemp(suffix='.adi')
+			try:
+				with os.fdopen(fd, 'wb') as out:
+					out.write(body)
+				start = time.perf_counter()
+				result = adifparse.validateLog(path, args)
+				metrics.validated(time.perf_counter() - start, result)
+			except SystemExit:
+				raise
+			except Exception as e:
+				# A bug in the parser fails this log, not the service
+				traceback.print_exc()
+				with metrics.lock:
+					metrics.failures = metrics.failures + 1
+				return (500, jsonReply({'error': 'the validator failed on this log: %s: %s' % (type(e).__name__, e)}))
+			finally:
+				os.unlink(path)
+				with metrics.lock:
+					metrics.inFlight = metrics.inFlight - 1
+		reply = jsonReply(result)
+		# A log cut short by its time budget may get further next time
+		if not result['truncated']:
+			self.remember(key, reply)
+		return (200, reply)
+
+class Handler(BaseHTTPRequestHandler):
+	def reply(self, code, body, contentType):
+		path = urlsplit(self.path).path
+		if not path in ('/validate', '/metrics'):
+			path = 'other'
+		self.server.service.metrics.request(path, code)
+		body = body.encode()
+		self.send_response(code)
+		self.send_header('Content-Type', contentType)
+		self.send_header('Content-Length', str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def replyJSON(self, code, result):
+		self.reply(code, jsonReply(result), 'application/json')
+
+	def do_GET(self):
+		if urlsplit(self.path).path == '/metrics':
+			self.reply(200, self.server.service.metrics.render(), 'text/plain; version=0.0.4; charset=utf-8')
+			return
+		self.replyJSON(404, {'error': 'not found'})
+
+	def do_POST(self):
+		url = urlsplit(self.path)
+		if url.path != '/validate':
+			self.replyJSON(404, {'error': 'not found'})
+			return
+		args = []
+		for (name, value) in parse_qsl(url.query, keep_blank_values=True):
+			if not name in queryOptions:
+				self.replyJSON(400, {'error': "unknown option '%s'" % (name)})
+				return
+			args.append('--' + name)
+			if queryOptions[name]:
+				args.append(value)
+		try:
+			size = int(self.headers.get('Content-Length', ''))
+		except ValueError:
+			self.replyJSON(411, {'error': 'Content-Length is needed'})
+			return
+		if size > self.server.service.opts.max_upload:
+			self.replyJSON(413, {'error': 'logs are limited to %d bytes' % (self.server.service.opts.max_upload)})
+			return
+		body = self.rfile.read(size)
+		try:
+			(code, reply) = self.server.service.validate(body, args)
+		except SystemExit:			# optparse turned the options down
+			(code, reply) = (400, jsonReply({'error': 'bad options %s' % (' '.join(args))}))
+		self.reply(code, reply, 'application/json')
+
+def jsonReply(result):
+	return json.dumps(result) + '\n'
+
+def makeServer(opts):
+	server = ThreadingHTTPServer((opts.host, opts.port), Handler)
+	server.service = ValidationService(opts)
+	return server
+
+def serve(opts):
+	server = makeServer(opts)
+	print("Validating ADIF logs on http://%s:%d/validate, metrics on /metrics" % (opts.host, server.server_port))
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	server.server_close()
+
+def main():
+	(opts, args) = option_parsing()
+	serve(opts)
+
+if __name__ == '__main__':
+	main()
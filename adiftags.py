@@ -811,7 +811,7 @@ pas = {
 		'EW' : [ '22:18', '32:18' ], 'GA' : [ '31:18' ], 'HA' : [ '31:18', '32:18' ],
 		'HK' : [ '24:19', '33:19', '34:19' ], 'HM' : [ '20:17', '21:17', '30:17', '31:17' ],
 		'IR' : [ '22:18', '23:18', '32:18', '33:18' ], 'JN' : [ '20:17', '21:17' ],
-		'KE' : [ '31:18' ], 'KJ' : [ '25:19' ',35:19' ],
+		'KE' : [ '31:18' ], 'KJ' : [ '25:19', '35:19' ],
 		'KK' : [ '21:18', '22:18', '23:18', '31:18', '32:18' ],
 		'KN' : [ '30:17' ], 'KT' : [ '25:19', '26:19', '35:19' ],
 		'MG' : [ '24:19', '25:19', '34:19' ], 'NS' : [ '31:18' ],
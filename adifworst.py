@@ -0,0 +1,190 @@
+#!/bin/python
+# K1MU ADIF Parser - worst case complexity checks
+# Copyright (c) 2020,2022
+#
+# Builds hostile logs - floods of errors, huge fields, records with no
+# <EOR>, runs of '<' - at doubling sizes and times adifparse on each.  The
+# growth of time and peak RSS against size is fitted on a log-log scale,
+# and a case fails if it grows faster than the allowed exponent, so that
+# quadratic behavior shows up here rather than on a member's upload.
+
+from optparse import OptionParser
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+import adifbench
+
+HEADER = b'Worst case log\n<ADIF_VER:5>3.1.0 <PROGRAMID:8>adifworst <EOH>\n'
+RECORD = b'<CALL:4>K1MU <QSO_DATE:8>20220101 <TIME_ON:4>1200 <BAND:3>20M <FREQ:6>14.074 <MODE:3>FT8 '
+
+# Limits raised so the hostile parts are parsed rather than cut short
+LIMITS = ['--max-field', '1000000000', '--max-record', '1000000000']
+
+# Runs that take less time on top of starting up than starting up itself
+# are noise, not a trend, and so is memory growth below this.  The log is
+# mapped into memory, so its own pages are not counted as growth.
+MIN_RSS = 1048576
+
+# Pieces a hostile part is written in, so this process stays small - a
+# child started by fork() begins with its parent's RSS as its peak
+CHUNK = 65536
+
+def repeat(out, piece, n):
+	step = max(1, CHUNK // len(piece))
+	while n > 0:
+		out.write(piece * min(step, n))
+		n = n - step
+
+def errors(out, n):
+	repeat(out, RECORD + b'<MODE:3>XYZ <NOT_A_TAG:1>X <NAME:3:Q>BOB <EOR>\n', n)
+
+def recordErrors(out, n):
+	out.write(RECORD)
+	for i in range(n):
+		out.write(b'<BAD_%d:1>X ' % (i))
+	out.write(b'<EOR>\n')
+
+def duplicates(out, n):
+	out.write(RECORD)
+	repeat(out, b'<NAME:3>BOB ', n)
+	out.write(b'<EOR>\n')
+
+def hugeField(out, n):
+	out.write(RECORD + b'<NOTES:%d>' % (n))
+	repeat(out, b'x', n)
+	out.write(b' <EOR>\n')
+
+def nonASCII(out, n):
+	out.write(RECORD + b'<NOTES:%d>' % (n))
+	repeat(out, b'\xe9', n)
+	out.write(b' <EOR>\n')
+
+def noEOR(out, n):
+	repeat(out, RECORD, n)
+
+def badLengths(out, n):
+	repeat(out, RECORD + b'<NAME:X>BOB <EOR>\n', n)
+
+def openBrackets(out, n):
+	out.write(RECORD)
+	repeat(out, b'<', n)
+	out.write(b'<EOR>\n')
+
+def newlines(out, n):
+	repeat(out, RECORD + b'<EOR>\n' + b'\n' * 9, n)
+
+# Each case with the size, in its own units, of its smallest run - large
+# enough that the run is not swamped by starting the interpreter
+cases = {
+	'errors' : (errors, 5000),
+	'record-errors' : (recordErrors, 40000),
+	'duplicates' : (duplicates, 40000),
+	'huge-field' : (hugeField, 8000000),
+	'non-ascii' : (nonASCII, 500000),
+	'no-eor' : (noEOR, 10000),
+	'bad-lengths' : (badLengths, 5000),
+	'brackets' : (openBrackets, 8000000),
+	'newlines' : (newlines, 10000),
+}
+
+def option_parsing(args=None):
+	parser = OptionParser(usage='%prog [options]')
+
+	parser.add_option('-c', '--cases', dest='cases', default=','.join(cases), help='Comma separated cases to run (default all)')
+	parser.add_option('--engines', dest='engines', default='fast', help='Comma separated engines to check (default fast)')
+	parser.add_option('-n', '--steps', dest='steps', type='int', default=4, help='Sizes to run each case at, doubling each time (default 4)')
+	parser.add_option('-x', '--scale', dest='scale', type='float', default=1.0, help='Multiply the starting sizes by this (default 1)')
+	parser.add_option('-t', '--max-exponent', dest='max_exponent', type='float', default=1.3, help='Highest growth exponent allowed for time and memory (default 1.3)')
+	parser.add_option('-r', '--repeat', dest='repeat', type='int', default=3, help='Runs of each, keeping the fastest (default 3)')
+	parser.add_option('-k', '--keep', dest='keep', help='Keep the generated logs in this directory')
+
+	(options, args) = parser.parse_args(args)
+	for case in options.cases.split(','):
+		if not case in cases:
+			parser.error("unknown case '%s'" % (case))
+	for engine in options.engines.split(','):
+		if not engine in adifbench.engines:
+			parser.error("unknown engine '%s'" % (engine))
+	if options.steps < 2:
+		parser.error("--steps must be at least 2")
+
+	return (options, args)
+
+def measure(path, engine, repeat):
+	best = None
+	for i in range(repeat):
+		result = adifbench.run(path, engine, 'full', LIMITS)
+		if best is None or result[0] < best[0]:
+			best = result
+	return best
+
+#
+# Slope of log(y) against log(x) by least squares, or None when the values
+# never rise above the noise floor
+#
+def exponent(sizes, values, floor):
+	points = [(math.log(x), math.log(y)) for (x, y) in zip(sizes, values) if y > floor]
+	if len(points) < 2:
+		return None
+	mx = sum(p[0] for p in points) / len(points)
+	my = sum(p[1] for p in points) / len(points)
+	sxx = sum((p[0] - mx) ** 2 for p in points)
+	if sxx == 0:
+		return None
+	return sum((p[0] - mx) * (p[1] - my) for p in points) / sxx
+
+def growth(slope):
+	if slope is None:
+		return 'flat'
+	return '%.2f' % (slope)
+
+def main():
+	(opts, args) = option_parsing()
+
+	directory = opts.keep or tempfile.mkdtemp(prefix='adifworst')
+	os.makedirs(directory, exist_ok=True)
+	failed = []
+	try:
+		empty = os.path.join(directory, 'empty.adi')
+		with open(empty, 'wb') as out:
+			out.write(HEADER)
+		print("%-8s %-14s %12s %9s %9s %10s" % ('Engine', 'Case', 'Size', 'MB', 'Seconds', 'Peak RSS'))
+		for engine in opts.engines.split(','):
+			(baseTime, baseRSS) = measure(empty, engine, opts.repeat)
+			for case in opts.cases.split(','):
+				(build, first) = cases[case]
+				sizes = [int(first * opts.scale) << step for step in range(opts.steps)]
+				times = []
+				rss = []
+				for size in sizes:
+					path = os.path.join(directory, '%s%d.adi' % (case, size))
+					if not os.path.exists(path):
+						with open(path, 'wb') as out:
+							out.write(HEADER)
+							build(out, size)
+					(elapsed, peak) = measure(path, engine, opts.repeat)
+					times.append(elapsed - baseTime)
+					rss.append(peak - baseRSS - os.path.getsize(path))
+					print("%-8s %-14s %12d %9.1f %9.2f %8.1fMB" % (engine, case, size, os.path.getsize(path) / 1048576.0, elapsed, peak / 1048576.0))
+					sys.stdout.flush()
+				timeSlope = exponent(sizes, times, baseTime)
+				rssSlope = exponent(sizes, rss, MIN_RSS)
+				verdict = 'ok'
+				if (timeSlope or 0) > opts.max_exponent or (rssSlope or 0) > opts.max_exponent:
+					verdict = 'FAILED'
+					failed.append('%s/%s' % (engine, case))
+				print("%-8s %-14s time growth %s, memory growth %s: %s" % (engine, case, growth(timeSlope), growth(rssSlope), verdict))
+				sys.stdout.flush()
+	finally:
+		if not opts.keep:
+			shutil.rmtree(directory)
+
+	if failed:
+		print("Superlinear growth in %s" % (', '.join(failed)))
+		sys.exit(1)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,9 @@
+# K1MU ADIF Parser - test setup
+# Copyright (c) 2020,2022
+#
+# The modules are flat files at the top of the tree.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,37 @@
+# K1MU ADIF Parser - library API
+# Copyright (c) 2020,2022
+
+import os
+
+import adifparse
+
+SAMPLES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'samples')
+
+def test_read_header_returns_tags_and_findings(capsys):
+	result = adifparse.readHeader(os.path.join(SAMPLES, 'mixed.adi'))
+	assert result['header'] == {'ADIF_VER': '3.1.0', 'PROGRAMID': 'TESTER', 'PROGRAMVERSION': '1.0', 'FOO': 'bar'}
+	assert result['errors'] == 1
+	assert [(f['rule'], f['line'], f['tag']) for f in result['findings']] == [('BAD_HEADER_TAG', 3, 'FOO')]
+	assert capsys.readouterr().out == ''
+
+def test_read_header_of_log_without_one(capsys):
+	result = adifparse.readHeader(os.path.join(SAMPLES, 'noheader.adi'))
+	assert result['header'] == {}
+	assert result['findings'] == []
+	assert capsys.readouterr().out == ''
+
+def test_validate_records_ignores_the_host_command_line(tmp_path, monkeypatch, capsys):
+	log = os.path.join(SAMPLES, 'mixed.adi')
+	index = str(tmp_path / 'mixed.adiidx')
+	adifparse.startRun(['-q', '-f', log, '-x', index])
+	adifparse.parseLog(log)
+	adifparse.recordIndex.userTags = adifparse.userTags
+	adifparse.recordIndex.save(index)
+	capsys.readouterr()
+	monkeypatch.setattr('sys.argv', ['host', '--host-only-flag', 'x'])
+	result = adifparse.validateRecords(log, [1], indexPath=index)
+	whole = adifparse.validateLog(log)
+	assert result['qsos'] == 1
+	assert result['findings'] and all(f['line'] == 6 for f in result['findings'])
+	assert result['findings'] == [f for f in whole['findings'] if f['line'] == 6]
+	assert capsys.readouterr().out == ''
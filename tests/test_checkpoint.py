@@ -0,0 +1,67 @@
+# K1MU ADIF Parser - checkpoints
+# Copyright (c) 2020,2022
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIXED = os.path.join(TOP, 'samples', 'mixed.adi')
+
+def runParser(*args):
+	return subprocess.run([sys.executable, os.path.join(TOP, 'adifparse.py')] + list(args),
+		stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+#
+# A checkpoint saved after the first few errors of the sample log
+#
+@pytest.fixture
+def checkpoint(tmp_path):
+	log = str(tmp_path / 'mixed.adi')
+	shutil.copy(MIXED, log)
+	path = str(tmp_path / 'mixed.ckpt')
+	runParser('-f', log, '-a', str(tmp_path / 'part1.txt'), '--max-errors', '3', '--checkpoint', path)
+	with open(path) as f:
+		saved = json.load(f)
+	assert not saved['complete'] and saved['log'] == os.path.abspath(log)
+	return (log, path, saved)
+
+def test_resumed_report_says_where_it_carries_on(checkpoint, tmp_path):
+	(log, path, saved) = checkpoint
+	part2 = str(tmp_path / 'part2.txt')
+	assert runParser('-f', log, '-a', part2, '--resume', path).returncode == 0
+	with open(part2) as f:
+		report = f.read()
+	note = "Continued from line %d, where the run before stopped" % (saved['line'])
+	assert report.index("with the ADIF standard.\n\n" + note) < report.index("ADIF Compliance error")
+	aggregated = runParser('-f', log, '-g', '--resume', path).stdout
+	assert note in aggregated
+
+def test_resume_keeps_the_earlier_reports(checkpoint, tmp_path):
+	(log, path, saved) = checkpoint
+	part1 = str(tmp_path / 'part1.txt')
+	with open(part1) as f:
+		before = f.read()
+	result = runParser('-f', log, '-a', part1, '--resume', path)
+	assert result.returncode == 2 and 'already exists' in result.stderr
+	result = runParser('-f', log, '-o', 'ndjson:' + part1, '--resume', path)
+	assert result.returncode == 2
+	with open(part1) as f:
+		assert f.read() == before
+
+def test_resume_with_other_options_or_log(checkpoint, tmp_path):
+	(log, path, saved) = checkpoint
+	assert saved['options']['engine'] == 'fast'
+	for args in (['-e', 'legacy'], ['--skip', 'zones'], ['-s'], ['--max-field', '100']):
+		result = runParser('-f', log, '-q', '--resume', path, *args)
+		assert result.returncode == 1 and '[ERROR]' in result.stdout, args
+	other = str(tmp_path / 'other.adi')
+	shutil.copy(log, other)
+	result = runParser('-f', other, '-q', '--resume', path)
+	assert result.returncode == 1 and 'was saved for %s' % (os.path.abspath(log)) in result.stdout
+	# The options that only change how much is reported may differ
+	assert runParser('-f', log, '-q', '--resume', path, '--max-errors', '100').returncode == 0
@@ -0,0 +1,34 @@
+# K1MU ADIF Parser - engine conformance
+# Copyright (c) 2020,2022
+
+import glob
+import os
+
+import pytest
+
+import adifconform
+
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(adifconform.SAMPLES, '*.adi'))), ids=os.path.basename)
+def test_fast_engine_matches_legacy(path):
+	(expected, elapsed) = adifconform.run(path, 'legacy')
+	(found, elapsed) = adifconform.run(path, 'fast')
+	assert found == expected
+
+@pytest.mark.parametrize('engine', ['legacy', 'fast'])
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(adifconform.SAMPLES, '*.adi'))), ids=os.path.basename)
+def test_engines_match_the_original_parser(path, engine):
+	expected = adifconform.original(path)
+	if expected is None:
+		assert os.path.basename(path) in adifconform.NO_GOLDEN
+		return
+	(found, elapsed) = adifconform.run(path, engine)
+	assert adifconform.asOriginal(found) == expected
+
+def test_empty_and_malformed_sizes_before_a_line_end(tmp_path):
+	log = tmp_path / 'sizes.adi'
+	log.write_bytes(b'<EOH>\n<CALL:4>K1MU <EO:>\n<CALL:4>W1AW <E:R>\n<NAME:0><EOR>\n')
+	(expected, elapsed) = adifconform.run(str(log), 'legacy')
+	(found, elapsed) = adifconform.run(str(log), 'fast')
+	assert found == expected
+	assert [line for line in found if "BAD_TAG: tag 'EO'" in line] == ["line 2 BAD_TAG: tag 'EO' () is not a valid tag in a QSO record"]
+	assert found[-1] == '5 lines, 1 QSOs'
@@ -0,0 +1,66 @@
+# K1MU ADIF Parser - limits on hostile logs
+# Copyright (c) 2020,2022
+
+import time
+
+import adifbench
+import adifparse
+
+HEADER = b'Flood\n<ADIF_VER:5>3.1.0 <EOH>\n'
+MB = 1048576
+
+#
+# A header and then a flood of unknown tags with no EOR, each one a finding
+#
+def writeFlood(path, n):
+	with open(path, 'wb') as out:
+		out.write(HEADER)
+		out.write(b''.join(b'<BAD_%d:1>X' % (i) for i in range(n)))
+
+def test_flood_without_eor_is_bounded(tmp_path):
+	empty = str(tmp_path / 'empty.adi')
+	with open(empty, 'wb') as out:
+		out.write(HEADER)
+	flood = str(tmp_path / 'flood.adi')
+	writeFlood(flood, 300000)
+	limits = ['--max-record', '262144']
+	for mode in ('quiet', 'full'):
+		(elapsed, base) = adifbench.run(empty, 'fast', mode, limits)
+		(elapsed, peak) = adifbench.run(flood, 'fast', mode, limits)
+		# Holding every finding would take well over 100 MB
+		assert peak - base < 32 * MB, mode
+
+def test_progress_without_eor(tmp_path, monkeypatch, capsys):
+	flood = str(tmp_path / 'flood.adi')
+	writeFlood(flood, 50000)
+	monkeypatch.setattr(adifparse, 'PROGRESS_INTERVAL', 0)
+	adifparse.validateLog(flood, ['-p'])
+	lines = capsys.readouterr().err.splitlines()
+	# One for each CHECK_BYTES of the log, and the last when it is done
+	assert len(lines) > 1 + 600000 // adifparse.CHECK_BYTES
+	assert all(' 0 QSOs' in line for line in lines)
+
+def test_time_budget_without_eor(tmp_path):
+	flood = str(tmp_path / 'flood.adi')
+	writeFlood(flood, 600000)
+	start = time.monotonic()
+	result = adifparse.validateLog(flood, timeBudget=0.5)
+	elapsed = time.monotonic() - start
+	assert result['truncated']
+	assert result['stopped'].startswith('Stopped at the time budget of 0.5 seconds')
+	assert result['offset'] < result['bytes']
+	assert elapsed < 1.5
+
+def test_record_findings_are_capped(tmp_path):
+	log = str(tmp_path / 'many.adi')
+	with open(log, 'wb') as out:
+		out.write(HEADER)
+		out.write(b''.join(b'<BAD_%d:1>X' % (i) for i in range(30)))
+		out.write(b'<CALL:4>K1MU<QSO_DATE:8>20200101<TIME_ON:4>1200<BAND:3>20m<MODE:2>CW<EOR>\n')
+	for engine in ('fast', 'legacy'):
+		result = adifparse.validateLog(log, ['-e', engine, '--max-record-findings', '10'])
+		assert result['errors'] == 30
+		rules = [f['rule'] for f in result['findings']]
+		assert rules == ['BAD_TAG'] * 10 + ['FINDINGS_NOT_LISTED']
+		assert result['findings'][-1]['message'] == '20 more compliance errors in this record are counted but not listed'
+		assert result['findings'][-1]['qso'] is not None
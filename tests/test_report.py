@@ -0,0 +1,62 @@
+# K1MU ADIF Parser - report sinks
+# Copyright (c) 2020,2022
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import adifparse
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIXED = os.path.join(TOP, 'samples', 'mixed.adi')
+
+def runParser(*args):
+	return subprocess.run([sys.executable, os.path.join(TOP, 'adifparse.py')] + list(args),
+		stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+def test_stopped_record_has_its_own_heading():
+	report = runParser('-f', MIXED, '--max-errors', '3')
+	heading = report.index("\nFor the incomplete record at line 6:\n")
+	assert report.index("For the QSO with K1MU") < heading
+	assert report.index("on line 6: The tag 'MODE'") > heading
+	assert report.index("on line 6: tag 'CQZ'") > heading
+
+def test_aggregate_keeps_each_records_context(tmp_path):
+	log = tmp_path / 'context.adi'
+	log.write_bytes(b'Two records\n<ADIF_VER:5>3.1.0 <EOH>\n'
+		b'<CALL:4>K1MU <QSO_DATE:8>20200101 <TIME_ON:4>1300 <TIME_OFF:4>1200 <BAND:3>20M <MODE:3>SSB <DXCC:3>291 <STATE:2>ZZ <EOR>\n'
+		b'<CALL:4>K1MU <QSO_DATE:8>20210505 <TIME_ON:4>2300 <TIME_OFF:4>1200 <BAND:3>20M <MODE:3>SSB <DXCC:1>1 <STATE:2>ZZ <EOR>\n'
+		b'<CALL:4>K1MU <QSO_DATE:8>20210505 <TIME_ON:4>2300 <TIME_OFF:4>1200 <BAND:3>20M <MODE:3>SSB <DXCC:1>1 <STATE:2>ZZ <EOR>\n')
+	report = runParser('-f', str(log), '-g')
+	assert "on line 3: State 'ZZ' is not valid for DXCC 291" in report
+	assert "2 times, on lines 4, 5: State 'ZZ' is not valid for DXCC 1 (CANADA)" in report
+	assert "on line 3: QSO TIME_OFF is 20200101/1200, which is before the QSO TIME_ON of 20200101/1300" in report
+	assert "2 times, on lines 4, 5: QSO TIME_OFF is 20210505/1200" in report
+
+def test_compress_is_refused_for_pages_and_sqlite(tmp_path):
+	for output in ('pages:' + str(tmp_path / 'pages'), 'sqlite:' + str(tmp_path / 'audit.db')):
+		with pytest.raises(SystemExit):
+			adifparse.option_parsing(['-f', MIXED, '--compress', '-o', output])
+	(opts, args) = adifparse.option_parsing(['-f', MIXED, '--compress', '-o', 'ndjson:' + str(tmp_path / 'out.nd')])
+	assert opts.compress
+
+def test_pages_title_an_incomplete_record(tmp_path):
+	pages = tmp_path / 'pages'
+	runParser('-f', MIXED, '--max-errors', '3', '-q', '-o', 'pages:' + str(pages))
+	index = (pages / 'index.html').read_text()
+	page = (pages / 'page0001.html').read_text()
+	assert '>Header</a> (1)' in index
+	assert '>Incomplete record at line 6</a> (2)' in index
+	assert page.index('<h4 id="qso1">Header</h4>') < page.index("line 3: tag 'FOO'")
+	assert page.index('<h4 id="qso2">Incomplete record at line 6</h4>') < page.index("line 6: The tag 'MODE'")
+
+def test_stats_writes_only_its_file(tmp_path):
+	stats = str(tmp_path / 'stats.json')
+	report = runParser('-f', MIXED, '--stats', stats)
+	assert report == runParser('-f', MIXED)
+	with open(stats) as f:
+		assert 'phases' in json.load(f)
+	assert 'Profile:' in runParser('-f', MIXED, '--profile')
@@ -0,0 +1,127 @@
+# K1MU ADIF Parser - validation service
+# Copyright (c) 2020,2022
+
+import http.client
+import json
+import os
+import re
+import threading
+
+import pytest
+
+import adifparse
+import adifserve
+
+MIXED = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'samples', 'mixed.adi')
+
+@pytest.fixture
+def server():
+	(opts, args) = adifserve.option_parsing(['--port', '0', '--max-upload', '100000'])
+	server = adifserve.makeServer(opts)
+	thread = threading.Thread(target=server.serve_forever)
+	thread.start()
+	yield server
+	server.shutdown()
+	thread.join()
+	server.server_close()
+
+def request(server, method, path, body=None, headers={}):
+	conn = http.client.HTTPConnection('127.0.0.1', server.server_port)
+	try:
+		# Sent by hand, as request() would add a Content-Length
+		conn.putrequest(method, path)
+		for name in headers:
+			conn.putheader(name, headers[name])
+		conn.endheaders(body)
+		response = conn.getresponse()
+		return (response.status, response.read().decode())
+	finally:
+		conn.close()
+
+def post(server, path, body):
+	return request(server, 'POST', path, body, {'Content-Length': str(len(body))})
+
+def metrics(server):
+	(status, text) = request(server, 'GET', '/metrics')
+	assert status == 200
+	samples = {}
+	for line in text.splitlines():
+		if not line.startswith('#'):
+			(name, value) = line.rsplit(' ', 1)
+			samples[name] = float(value)
+	return samples
+
+def test_validate_and_metrics(server, capsys):
+	with open(MIXED, 'rb') as log:
+		body = log.read()
+	(status, reply) = post(server, '/validate', body)
+	assert status == 200
+	result = json.loads(reply)
+	assert result == adifparse.validateLog(MIXED)
+	assert result['qsos'] > 0 and result['findings']
+	(status, again) = post(server, '/validate', body)
+	assert again == reply
+
+	samples = metrics(server)
+	assert samples['adif_requests_total{path="/validate",code="200"}'] == 2
+	assert samples['adif_qsos_total'] == result['qsos']
+	assert samples['adif_bytes_total'] == len(body)
+	assert samples['adif_cache_hits_total'] == 1
+	assert samples['adif_cache_misses_total'] == 1
+	# The buckets are cumulative and end with +Inf, the count of validations
+	buckets = [samples[name] for name in samples if name.startswith('adif_validation_seconds_bucket')]
+	assert len(buckets) == len(adifserve.LATENCY_BUCKETS) + 1
+	assert buckets == sorted(buckets)
+	assert buckets[-1] == samples['adif_validation_seconds_count'] == 1
+	rules = {}
+	for f in result['findings']:
+		rules[(f['rule'], f['severity'])] = rules.get((f['rule'], f['severity']), 0) + 1
+	for ((rule, severity), n) in rules.items():
+		assert samples['adif_findings_total{rule="%s",severity="%s"}' % (rule, severity)] == n
+	# The parser's messages stay out of the service's output
+	assert capsys.readouterr().out == ''
+
+def test_info_comes_back_in_the_result(server, capsys):
+	(status, reply) = post(server, '/validate', b'<CALL:4>K1MU <EOR>\n')
+	assert status == 200
+	assert json.loads(reply)['info'] == ['This ADIF file has no header']
+	assert capsys.readouterr().out == ''
+
+def test_rejected_requests(server):
+	assert post(server, '/validate?bogus=1', b'<EOR>')[0] == 400
+	assert post(server, '/validate?engine=bogus', b'<EOR>')[0] == 400
+	assert request(server, 'POST', '/validate', None, {})[0] == 411
+	assert post(server, '/validate', b'x' * 100001)[0] == 413
+	server.service.opts.max_queue = 0
+	assert post(server, '/validate', b'<CALL:4>K1MU <EOR>\n')[0] == 503
+	samples = metrics(server)
+	for code in (400, 411, 413, 503):
+		assert samples['adif_requests_total{path="/validate",code="%d"}' % (code)] >= 1
+	assert samples['adif_validation_seconds_count'] == 0
+
+def test_cache_is_bounded_in_bytes():
+	(opts, args) = adifserve.option_parsing(['--cache-bytes', '1000'])
+	service = adifserve.ValidationService(opts)
+	service.remember('a', 'x' * 600)
+	service.remember('b', 'x' * 300)
+	service.remember('c', 'x' * 600)
+	assert list(service.cache) == ['b', 'c'] and service.cacheBytes == 900
+	service.remember('d', 'x' * 1001)
+	assert not 'd' in service.cache
+
+def test_parser_failure_is_a_500(server):
+	# MY_CQZ with no MY_ITUZ trips over a bug in the zone checks
+	bad = b'Zones\n<ADIF_VER:5>3.1.0 <EOH>\n<CALL:4>K1MU <QSO_DATE:8>20200101 <TIME_ON:4>1200 <BAND:3>20M <MODE:2>CW <MY_DXCC:3>291 <MY_CQZ:1>5 <EOR>\n'
+	(status, reply) = post(server, '/validate', bad)
+	assert status == 500
+	assert 'zmapkey' in json.loads(reply)['error']
+	samples = metrics(server)
+	assert samples['adif_requests_total{path="/validate",code="500"}'] == 1
+	assert samples['adif_validation_failures_total'] == 1
+	assert samples['adif_jobs_in_flight'] == 0
+	assert not server.service.cache
+	# The next log is validated from a clean start
+	with open(MIXED, 'rb') as log:
+		(status, reply) = post(server, '/validate', log.read())
+	assert status == 200
+	assert json.loads(reply) == adifparse.validateLog(MIXED)
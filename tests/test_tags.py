@@ -0,0 +1,21 @@
+# K1MU ADIF Parser - ADIF tables
+# Copyright (c) 2020,2022
+
+import adifparse
+import adiftags
+
+def test_state_zone_lists_are_itu_cq_pairs():
+	for dxcc in adiftags.pas:
+		for state in adiftags.pas[dxcc]:
+			for zones in adiftags.pas[dxcc][state] or []:
+				(itu, cq) = zones.split(':')
+				assert int(itu) > 0 and int(cq) > 0, (dxcc, state, zones)
+
+def test_zones_of_a_kj_qso(tmp_path):
+	log = tmp_path / 'kj.adi'
+	log.write_bytes(b'KJ\n<EOH>\n<CALL:5>UA0AA <QSO_DATE:8>20200101 <TIME_ON:4>1200 <BAND:3>20M <MODE:2>CW '
+		b'<DXCC:2>15 <STATE:2>KJ <CQZ:2>19 <ITUZ:2>35 <EOR>\n'
+		b'<CALL:5>UA0AA <QSO_DATE:8>20200101 <TIME_ON:4>1300 <BAND:3>20M <MODE:2>CW '
+		b'<DXCC:2>15 <STATE:2>KJ <CQZ:2>18 <ITUZ:2>30 <EOR>\n')
+	result = adifparse.validateLog(str(log))
+	assert [(f['rule'], f['line']) for f in result['findings']] == [('BAD_ITUZ', 4), ('BAD_CQZ', 4)]
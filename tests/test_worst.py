@@ -0,0 +1,21 @@
+# K1MU ADIF Parser - worst case complexity checks
+# Copyright (c) 2020,2022
+
+import pytest
+
+import adifworst
+
+SIZES = [40000, 80000, 160000, 320000]
+
+def test_linear_growth_fits_an_exponent_of_one():
+	assert adifworst.exponent(SIZES, [0.4, 0.8, 1.6, 3.2], 0.1) == pytest.approx(1.0)
+
+def test_runs_below_the_floor_are_left_out():
+	# Start-up noise in the first run would otherwise read as superlinear
+	assert adifworst.exponent(SIZES, [0.01, 0.8, 1.6, 3.2], 0.1) == pytest.approx(1.0)
+	assert adifworst.exponent(SIZES, [0.01, 0.02, 0.03, 0.2], 0.1) is None
+
+def test_small_memory_growth_is_checked():
+	mb = 1048576
+	slope = adifworst.exponent(SIZES, [2 * mb, 8 * mb, 32 * mb, 128 * mb], adifworst.MIN_RSS)
+	assert slope == pytest.approx(2.0)